@@ -7,14 +7,13 @@ from sqlalchemy import *
 from sqlalchemy import exc
 import warnings
 import sys
-import os
 import argparse
 import re
 from dateutil import parser as dateparser
 from datetime import datetime, timedelta
 from pytimeparse.timeparse import timeparse
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 db = None
 con = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import os
+import hashlib
+import pickle
+
+class Cache(object):
+    """On-disk content-addressed cache with size-bounded LRU eviction.
+
+    Entries are keyed by a hash of the content they were derived from together with
+    whatever else determines the result, such as the output format and extractor
+    version. Each entry is a pickle file whose modification time records when it was
+    last used; the least recently used entries are removed when the total size of the
+    cache exceeds its limit. Writes are atomic so several processes may share a cache.
+
+    Eviction goes below the limit, to LOWWATER of it, so that the walk of the cache it
+    needs is made once in many writes rather than on every write to a full cache.
+    """
+
+    LOWWATER = 0.9
+
+    def __init__(self, directory, maxsize):
+        self.directory = directory
+        self.maxsize   = maxsize
+        self.size      = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(data, *parts):
+        digest = hashlib.sha256(data)
+        for part in parts:
+            digest.update(b'\0' + str(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[0:2], key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entryfile:
+                value = pickle.load(entryfile)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmppath = path + '.' + str(os.getpid())
+        with open(tmppath, 'wb') as entryfile:
+            pickle.dump(value, entryfile, pickle.HIGHEST_PROTOCOL)
+        # An entry being rewritten no longer counts towards the size
+        try:
+            oldsize = os.path.getsize(path)
+        except OSError:
+            oldsize = 0
+        os.replace(tmppath, path)
+
+        if self.size is None:
+            self.size = sum(size for mtime, size, path in self.entries())
+        else:
+            self.size += os.path.getsize(path) - oldsize
+        if self.size > self.maxsize:
+            self.evict()
+
+    def entries(self):
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                # Skip partially written entries
+                if '.' in filename:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    # Remove least recently used entries until the cache is back down to its low-water
+    # mark, keeping the running size up to date.
+    def evict(self):
+        entries = sorted(self.entries())
+        self.size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self.size <= self.maxsize * Cache.LOWWATER:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.size -= size
+
+caches = {}
+
+# Return the cache for a directory, or None if no directory is given. Each process
+# opens its own, so the cache can be used from worker processes.
+def get_cache(directory, maxsize):
+    if directory is None:
+        return None
+    cache = caches.get(directory)
+    if cache is None:
+        cache = Cache(directory, maxsize)
+        caches[directory] = cache
+    return cache
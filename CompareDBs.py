@@ -18,19 +18,18 @@
 
 from __future__ import print_function
 import NVivo
+from Schema import load_schema
 from sqlalchemy import *
 from sqlalchemy import exc
 import warnings
 import sys
-import os
 import argparse
 import re
-from dateutil import parser as dateparser
 import datetime
 from pytimeparse.timeparse import timeparse
 from xml.dom.minidom import *
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 db = None
 con = None
@@ -54,16 +53,14 @@ try:
         args.db1 = NVivo.mount(args.db1)
 
     db1 = create_engine(args.db1)
-    md1 = MetaData(bind=db1)
-    md1.reflect(db1)
+    md1 = load_schema(db1, args.tables)
     con1 = db1.connect()
 
     if '://' not in args.db2:
         args.db2 = NVivo.mount(args.db2)
 
     db2 = create_engine(args.db2)
-    md2 = MetaData(bind=db2)
-    md2.reflect(db2)
+    md2 = load_schema(db2, args.tables)
     con2 = db2.connect()
 
     def buildTableMatchDicts(tableName, matchCols):
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import os
+import sys
+import re
+import time
+import socket
+import atexit
+import subprocess
+import tempfile
+import shutil
+from multiprocessing import util
+from xml.dom.minidom import Document
+from io import StringIO
+
+# Versions of our text extraction and document conversion, which form part of the key of
+# cached results. Change these when the output of either changes. The PDF key also takes
+# the version of pdfminer, which is only loaded once a PDF needs its text extracted.
+PDFVERSION     = '1'
+CONVERTVERSION = 'unoconv/1'
+
+helperpath = os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'helpers' + os.path.sep
+
+# Find the unoconv executable, looking first on the path for an OS installed version,
+# otherwise using our copy.
+def find_unoconv(verbosity=1):
+    if verbosity > 1:
+        print("Searching for unoconv executable.", file=sys.stderr)
+    for path in os.environ["PATH"].split(os.pathsep) + [helperpath]:
+        unoconvpath = os.path.join(path, 'unoconv')
+        if os.path.exists(unoconvpath):
+            if os.access(unoconvpath, os.X_OK) and '' in os.environ.get("PATHEXT", "").split(os.pathsep):
+                return [unoconvpath]
+            else:
+                return ['python', unoconvpath]
+
+    raise RuntimeError("Can't find unoconv on path. Please refer to the NVivotools README file.")
+
+class Converter(object):
+    """Document conversion through a persistent headless office listener.
+
+    The listener is started on first use and kept for the life of the process, so that
+    each conversion pays only the cost of a unoconv client connecting to it rather than
+    that of starting the office suite. A listener that has crashed or hangs on a document
+    is restarted and the conversion retried once.
+    """
+
+    # Seconds to wait for a new listener to accept connections
+    STARTTIMEOUT = 60
+    # Seconds allowed for the conversion of a single document
+    TIMEOUT = 300
+
+    def __init__(self, verbosity=1, timeout=None):
+        self.verbosity  = verbosity
+        self.timeout    = timeout or Converter.TIMEOUT
+        self.unoconvcmd = None
+        self.listener   = None
+        self.port       = None
+
+    def start(self):
+        if self.unoconvcmd is None:
+            self.unoconvcmd = find_unoconv(self.verbosity)
+
+        # Let the OS choose a free port for the listener
+        freesocket = socket.socket()
+        freesocket.bind(('127.0.0.1', 0))
+        self.port = str(freesocket.getsockname()[1])
+        freesocket.close()
+
+        cmd = self.unoconvcmd + ['--listener', '--server=127.0.0.1', '--port=' + self.port]
+        if self.verbosity > 1:
+            print("Starting office listener: ", cmd, file=sys.stderr)
+        self.listener = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        starttime = time.time()
+        while True:
+            returncode = self.listener.poll()
+            if returncode is not None:
+                self.listener = None
+                raise RuntimeError("Office listener exited with code " + str(returncode))
+            try:
+                socket.create_connection(('127.0.0.1', int(self.port)), 1).close()
+                break
+            except socket.error:
+                if time.time() - starttime > Converter.STARTTIMEOUT:
+                    self.stop()
+                    raise RuntimeError("Timed out waiting for office listener to start.")
+                time.sleep(0.2)
+
+    def stop(self):
+        if self.listener is not None:
+            if self.verbosity > 1:
+                print("Stopping office listener.", file=sys.stderr)
+            self.listener.terminate()
+            try:
+                self.listener.wait(10)
+            except subprocess.TimeoutExpired:
+                self.listener.kill()
+            self.listener = None
+
+    # Convert a document to the given unoconv format. Note that unoconv replaces the
+    # extension of output with that of the format.
+    def convert(self, filename, format, output):
+        for attempt in range(2):
+            if self.listener is None or self.listener.poll() is not None:
+                self.listener = None
+                self.start()
+
+            cmd = self.unoconvcmd + ['--no-launch', '--server=127.0.0.1', '--port=' + self.port,
+                                     '--format=' + format, '--output=' + output, filename]
+            if self.verbosity > 1:
+                print("Running: ", cmd, file=sys.stderr)
+            try:
+                p = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                err = "Conversion of " + filename + " timed out after " + str(self.timeout) + " seconds."
+                self.stop()
+                continue
+
+            err = p.stderr
+            if not err:
+                return output
+
+            # Restart the listener if it crashed, otherwise the document itself is at fault
+            if self.listener.poll() is None:
+                break
+            self.listener = None
+
+        raise RuntimeError("unoconv invocation error: " + str(cmd) + "\n" + err)
+
+converter = None
+
+# Return the converter for this process, creating it if necessary. Worker processes
+# each get their own, so a process pool also gives a pool of listeners.
+def get_converter(verbosity=1):
+    global converter
+    if converter is None:
+        converter = Converter(verbosity)
+        # Worker processes exit without running atexit handlers, but do run
+        # multiprocessing finalizers.
+        atexit.register(converter.stop)
+        util.Finalize(converter, converter.stop, exitpriority=10)
+    return converter
+
+# Extract the text of a PDF document along with the NVivo PdfPages XML describing its
+# pages, using the cache if one is given.
+def pdftext(data, cache=None):
+    import pdfminer
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfpage import PDFPage
+
+    if cache is not None:
+        key = cache.key(data, 'PDF', 'pdfminer-' + str(getattr(pdfminer, '__version__', '')) + '/' + PDFVERSION)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    doc = Document()
+    pages = doc.createElement("PdfPages")
+    pages.setAttribute("xmlns", "http://qsr.com.au/XMLSchema.xsd")
+
+    # Write out PDF object into a temporary file, then read it using pdfminer
+    tmpfilename = tempfile.mktemp()
+    tmpfileptr  = open(tmpfilename, 'wb')
+    tmpfileptr.write(data)
+    tmpfileptr.close()
+    rsrcmgr = PDFResourceManager()
+    retstr = StringIO()
+    laparams = LAParams()
+    device = TextConverter(rsrcmgr, retstr, laparams=laparams)
+    tmpfileptr = open(tmpfilename, 'rb')
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    pdfpages = PDFPage.get_pages(tmpfileptr, password='', check_extractable=True)
+    pageoffset = 0
+    pdfstr = u''
+    for pdfpage in pdfpages:
+        mediabox   = pdfpage.attrs['MediaBox']
+
+        interpreter.process_page(pdfpage)
+        pageelement = pages.appendChild(doc.createElement("PdfPage"))
+        pageelement.setAttribute("PageLength", str(retstr.tell()))
+        pageelement.setAttribute("PageOffset", str(pageoffset))
+        pageelement.setAttribute("PageWidth",  str(int(mediabox[2] - mediabox[0])))
+        pageelement.setAttribute("PageHeight", str(int(mediabox[3] - mediabox[1])))
+
+        pagestr = str(retstr.getvalue())
+        pagestr = re.sub('(?<!\n)\n(?!\n)', ' ', pagestr).replace('\n\n', '\n').replace('\x00','')
+        retstr.truncate(0)
+        pdfstr += pagestr
+        pageoffset += len(pagestr)
+
+    tmpfileptr.close()
+    os.remove(tmpfilename)
+
+    result = {'PlainText': pdfstr, 'PdfPages': pages.toxml()}
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+# Convert a document held in memory to the given unoconv format, using the cache if one
+# is given, and return the converted document.
+def convert_document(data, extension, format, cache=None, verbosity=1):
+    if cache is not None:
+        key = cache.key(data, extension.upper(), format, CONVERTVERSION)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # unoconv replaces the extension of the output file name with that of the format,
+    # so work in a temporary directory and take whatever output file appears there.
+    tmpdirname = tempfile.mkdtemp()
+    try:
+        tmpfileptr = open(os.path.join(tmpdirname, 'source.' + extension), 'wb')
+        tmpfileptr.write(data)
+        tmpfileptr.close()
+        get_converter(verbosity).convert(os.path.join(tmpdirname, 'source.' + extension), format, os.path.join(tmpdirname, 'output'))
+        outfilenames = [filename for filename in os.listdir(tmpdirname) if filename.startswith('output.')]
+        if not outfilenames:
+            raise RuntimeError("unoconv did not produce any output for format " + format)
+        result = open(os.path.join(tmpdirname, outfilenames[0]), 'rb').read()
+    finally:
+        shutil.rmtree(tmpdirname, ignore_errors=True)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
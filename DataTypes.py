@@ -21,11 +21,24 @@ try:
 except:
     sqlany = False
 
-from sqlalchemy.databases import mssql, sqlite
+from sqlalchemy.dialects.mssql import base as mssql
+from sqlalchemy.dialects.sqlite import base as sqlite
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.dialects.mssql import UNIQUEIDENTIFIER
-from sqlalchemy import TypeDecorator, BINARY, TEXT, String
+from sqlalchemy import TypeDecorator, BINARY, CHAR, TEXT, String
+from sqlalchemy.types import NullType
 import uuid
+import zlib
+
+# Interpret a string such as 'yes' or 'false' as a truth value, as distutils did
+def strtobool(value):
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    elif value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    else:
+        raise ValueError("invalid truth value " + repr(value))
 
 class UUID(TypeDecorator):
     """Platform-independent UUID type.
@@ -63,6 +76,141 @@ class UUID(TypeDecorator):
         else:
             return value
 
+class BinaryUUID(TypeDecorator):
+    """UUID stored as 16 bytes.
+
+    An alternative to UUID for normalised files, which halves the size of every key
+    and index and avoids formatting and parsing a string for each value. Columns of
+    this type are declared as UUIDBLOB in SQLite so that reflection can tell them
+    apart from those holding UUIDs as strings.
+
+    """
+    impl = BINARY
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        elif isinstance(value, uuid.UUID):
+            return value.bytes
+        elif isinstance(value, bytes) and len(value) == 16:
+            return value
+        else:
+            return uuid.UUID(value).bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        else:
+            return uuid.UUID(bytes=bytes(value))
+
+# Each compressed value starts with a marker and a byte naming the codec that compressed
+# it, so that values written with different codecs, or before compression was turned
+# on, can be read side by side.
+COMPRESSIONMARKER = b'\x00NVZ'
+COMPRESSIONCODECS = {'zlib': b'\x01', 'zstd': b'\x02'}
+
+def compress_value(data, codec):
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Compression with zstd needs the zstandard module")
+        compressed = zstandard.ZstdCompressor(level=9).compress(data)
+    else:
+        compressed = zlib.compress(data, 9)
+
+    return COMPRESSIONMARKER + COMPRESSIONCODECS[codec] + compressed
+
+# Return the original of a compressed value, or the value itself if it is not compressed
+def decompress_value(value):
+    value = bytes(value)
+    if value[0:len(COMPRESSIONMARKER)] != COMPRESSIONMARKER:
+        return value
+
+    codec = value[len(COMPRESSIONMARKER):len(COMPRESSIONMARKER)+1]
+    data  = value[len(COMPRESSIONMARKER)+1:]
+    if codec == COMPRESSIONCODECS['zstd']:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading data compressed with zstd needs the zstandard module")
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif codec == COMPRESSIONCODECS['zlib']:
+        return zlib.decompress(data)
+    else:
+        raise RuntimeError("Unknown compression codec")
+
+class CompressedBinary(TypeDecorator):
+    """Binary data stored compressed.
+
+    Used in normalised files for source objects, which are written with the codec of
+    the class and read whatever codec they were written with. The column is declared
+    with the codec as its type in SQLite, for example ZLIBBLOB, so that reflection finds
+    the right class.
+
+    """
+    impl = NullType
+    codec = 'zlib'
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        else:
+            return compress_value(bytes(value), self.codec)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        else:
+            return decompress_value(value)
+
+class CompressedText(TypeDecorator):
+    """Text stored compressed, as CompressedBinary. Text stored before the column was
+    compressed is read as it is.
+
+    """
+    impl = NullType
+    codec = 'zlib'
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        else:
+            return compress_value(value.encode('utf-8'), self.codec)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        else:
+            return decompress_value(value).decode('utf-8')
+
+class ZstdCompressedBinary(CompressedBinary):
+    codec = 'zstd'
+
+class ZstdCompressedText(CompressedText):
+    codec = 'zstd'
+
+# The compressed types that write each codec, as (binary, text)
+COMPRESSEDTYPES = {
+    'zlib': (CompressedBinary,     CompressedText),
+    'zstd': (ZstdCompressedBinary, ZstdCompressedText)
+}
+
+@compiles(CompressedBinary, 'sqlite')
+def compile_CompressedBinary_sqlite(element, compiler, **kw):
+    return element.codec.upper() + 'BLOB'
+
+@compiles(CompressedText, 'sqlite')
+def compile_CompressedText_sqlite(element, compiler, **kw):
+    return element.codec.upper() + 'TEXT'
+
+@compiles(BinaryUUID, 'sqlite')
+def compile_BinaryUUID_sqlite(element, compiler, **kw):
+    return 'UUIDBLOB'
+
 @compiles(UUID, 'sqlite')
 def compile_UUID_mssql_sqlite(element, compiler, **kw):
     """ SQLite doesn't care too much about type names, UNIQUEIDENTIFIER is fine. """
@@ -73,6 +221,11 @@ mssql.ischema_names['uniqueidentifier'] = UUID
 
 sqlite.ischema_names['UNIQUEIDENTIFIER'] = UUID
 sqlite.ischema_names['UUIDTEXT'] = UUID
+sqlite.ischema_names['UUIDBLOB'] = BinaryUUID
+sqlite.ischema_names['ZLIBBLOB'] = CompressedBinary
+sqlite.ischema_names['ZLIBTEXT'] = CompressedText
+sqlite.ischema_names['ZSTDBLOB'] = ZstdCompressedBinary
+sqlite.ischema_names['ZSTDTEXT'] = ZstdCompressedText
 
 if sqlany:
     sqlalchemy_sqlany.dialect.ischema_names['xml'] = String
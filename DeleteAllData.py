@@ -5,11 +5,10 @@ from sqlalchemy import exc, TypeDecorator, CHAR, String, create_engine, MetaData
 from sqlalchemy.engine import reflection
 import warnings
 import sys
-import os
 import argparse
 import uuid
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 try:
     parser = argparse.ArgumentParser(description='Delete all data leaving only database structure.')
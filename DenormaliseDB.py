@@ -19,43 +19,60 @@
 import argparse
 import NVivo
 
-parser = argparse.ArgumentParser(description='Denormalise a normalised NVivo project.')
-parser.add_argument('-w', '--windows', action='store_true',
-                    help='Correct NVivo for Windows string coding. Use if offloaded file will be used with Windows version of NVivo.')
-parser.add_argument('-m', '--mac',  action='store_true',
-                    help='Use NVivo for Mac database format.')
-
-parser.add_argument('-v', '--verbosity', type=int, default=1)
-
-parser.add_argument('-nv', '--nvivoversion', choices=["10", "11"], default="10",
-                    help='NVivo version (10 or 11)')
-
-parser.add_argument('-u', '--users', choices=["skip", "merge", "overwrite", "replace"], default="merge",
-                    help='User action.')
-parser.add_argument('-p', '--project', choices=["skip", "overwrite"], default="overwrite",
-                    help='Project action.')
-parser.add_argument('-nc', '--node-categories', choices=["skip", "merge", "overwrite"], default="merge",
-                    help='Node category action.')
-parser.add_argument('-n', '--nodes', choices=["skip", "merge"], default="merge",
-                    help='Node action.')
-parser.add_argument('-na', '--node-attributes', choices=["skip", "merge", "overwrite"], default="merge",
-                    help='Node attribute table action.')
-parser.add_argument('-sc', '--source-categories', choices=["skip", "merge", "overwrite"], default="merge",
-                    help='Source category action.')
-parser.add_argument('--sources', choices=["skip", "merge", "overwrite"], default="merge",
-                    help='Source action.')
-parser.add_argument('-sa', '--source-attributes', choices=["skip", "merge", "overwrite"], default="merge",
-                    help='Source attribute action.')
-parser.add_argument('-t', '--taggings', choices=["skip", "merge"], default="merge",
-                    help='Tagging action.')
-parser.add_argument('-a', '--annotations', choices=["skip", "merge"], default="merge",
-                    help='Annotation action.')
-
-parser.add_argument('indb', type=str,
-                    help='SQLAlchemy path of input normalised database.')
-parser.add_argument('outdb', type=str, nargs='?',
-                    help='SQLAlchemy path of input output NVivo database.')
-
-args = parser.parse_args()
-
-NVivo.Denormalise(args)
+def DenormaliseDB(arglist=None):
+
+    parser = argparse.ArgumentParser(description='Denormalise a normalised NVivo project.')
+    parser.add_argument('-w', '--windows', action='store_true',
+                        help='Correct NVivo for Windows string coding. Use if offloaded file will be used with Windows version of NVivo.')
+    parser.add_argument('-m', '--mac',  action='store_true',
+                        help='Use NVivo for Mac database format.')
+
+    parser.add_argument('-v', '--verbosity', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Number of rows per bulk database statement.')
+    parser.add_argument('--stats-file', type=str,
+                        help='Write per-phase timing, row count and memory statistics to this JSON file.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes used to convert sources.')
+    parser.add_argument('--cache-dir', type=str,
+                        help='Directory in which to cache extracted text and converted documents.')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Maximum size of the cache in megabytes.')
+
+    parser.add_argument('-nv', '--nvivoversion', choices=["10", "11"], default="10",
+                        help='NVivo version (10 or 11)')
+
+    parser.add_argument('-u', '--users', choices=["skip", "merge", "overwrite", "replace"], default="merge",
+                        help='User action.')
+    parser.add_argument('-p', '--project', choices=["skip", "overwrite"], default="overwrite",
+                        help='Project action.')
+    parser.add_argument('-nc', '--node-categories', choices=["skip", "merge", "overwrite"], default="merge",
+                        help='Node category action.')
+    parser.add_argument('-n', '--nodes', choices=["skip", "merge"], default="merge",
+                        help='Node action.')
+    parser.add_argument('-na', '--node-attributes', choices=["skip", "merge", "overwrite"], default="merge",
+                        help='Node attribute table action.')
+    parser.add_argument('-sc', '--source-categories', choices=["skip", "merge", "overwrite"], default="merge",
+                        help='Source category action.')
+    parser.add_argument('--sources', choices=["skip", "merge", "overwrite"], default="merge",
+                        help='Source action.')
+    parser.add_argument('-sa', '--source-attributes', choices=["skip", "merge", "overwrite"], default="merge",
+                        help='Source attribute action.')
+    parser.add_argument('-t', '--taggings', choices=["skip", "merge"], default="merge",
+                        help='Tagging action.')
+    parser.add_argument('-a', '--annotations', choices=["skip", "merge"], default="merge",
+                        help='Annotation action.')
+
+    parser.add_argument('indb', type=str,
+                        help='SQLAlchemy path of input normalised database.')
+    parser.add_argument('outdb', type=str, nargs='?',
+                        help='SQLAlchemy path of input output NVivo database.')
+
+    args = parser.parse_args(arglist)
+
+    NVivo.Denormalise(args)
+
+# Worker processes started by --jobs import this script afresh where processes are
+# spawned rather than forked, so it must do nothing unless run as the main program.
+if __name__ == '__main__':
+    DenormaliseDB(None)
@@ -5,7 +5,6 @@ from sqlalchemy import exc, TypeDecorator, CHAR, String, create_engine, MetaData
 from sqlalchemy.engine import reflection
 import warnings
 import sys
-import os
 import argparse
 import uuid
 from sqlalchemy.schema import (
@@ -16,8 +15,6 @@ from sqlalchemy.schema import (
     DropConstraint,
     )
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
-
 try:
     parser = argparse.ArgumentParser(description='Drop certain foreign keys.')
     parser.add_argument('database', type=str)
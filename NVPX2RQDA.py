@@ -19,21 +19,14 @@
 from __future__ import print_function
 import os
 import subprocess
-import re
 import sys
 
-# First set up environment for SQL Anywhere server and restart process if necessary
-helperpath = os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'helpers' + os.path.sep
+from sqlanyTools import sqlanysetup
 
-# Set environment variables for SQL Anywhere server
-if not os.environ.get('_sqlanywhere'):
-    envlines = subprocess.check_output(helperpath + 'sqlanyenv.sh', text=True).splitlines()
-    for envline in envlines:
-        env = re.match(r"(?P<name>\w+)=(?P<quote>['\"]?)(?P<value>.+)(?P=quote)", envline).groupdict()
-        os.environ[env['name']] = env['value']
+# First set up environment for SQL Anywhere server, restarting process only if necessary
+helperpath = os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'helpers' + os.path.sep
 
-    os.environ['_sqlanywhere'] = 'TRUE'
-    os.execv(sys.argv[0], sys.argv)
+sqlanysetup()
 
 # Environment is now ready
 import argparse
@@ -16,20 +16,327 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
+from __future__ import print_function
+import re
+import sys
+import hashlib
 from sqlalchemy import *
-from sqlalchemy import exc
+from sqlalchemy import exc, event
 import uuid
+from Stats import profile
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
+
+# Secondary indexes maintained on normalised files, as (table, columns)
+NORMINDEXES = [
+    ('Node',        ('Parent',)),
+    ('Node',        ('Category',)),
+    ('Node',        ('Name',)),
+    ('NodeValue',   ('Attribute',)),
+    ('Source',      ('Name',)),
+    ('Source',      ('Category',)),
+    ('SourceValue', ('Attribute',)),
+    ('Tagging',     ('Source',)),
+    ('Tagging',     ('Node',)),
+    ('Tagging',     ('Source', 'StartX', 'EndX'))
+]
+
+# Create any of the managed indexes on the given tables, or all tables, that do not
+# already exist, and return the names of the indexes created. Indexes on columns that
+# a table does not have, as in files made by older versions, are skipped.
+def create_norm_indexes(md, con, tablenames=None, verbosity=1):
+    inspector = inspect(con)
+    created = []
+    for tablename, columnnames in NORMINDEXES:
+        table = md.tables.get(tablename)
+        if table is None or (tablenames is not None and tablename not in tablenames):
+            continue
+        if not all(columnname in table.c for columnname in columnnames):
+            continue
+
+        indexname = 'ix_' + tablename + '_' + '_'.join(columnnames)
+        if indexname in [index['name'] for index in inspector.get_indexes(tablename)]:
+            continue
+
+        index = ([index for index in table.indexes if index.name == indexname] or [Index(indexname, *[table.c[columnname] for columnname in columnnames])])[0]
+        if verbosity > 1:
+            print("Creating index " + indexname, file=sys.stderr)
+        index.create(con)
+        created.append(indexname)
+
+    return created
+
+# A tagging Fragment is 'StartX:EndX' for text, with ',StartY[:EndY]' added for
+# tabular sources, all counted from 1 and inclusive. The same numbers are stored in
+# integer columns of Tagging so that taggings can be found by position in SQL.
+FRAGMENTREGEX   = re.compile(r'([0-9]+):([0-9]+)(?:,([0-9]+)(?::([0-9]+))?)?')
+FRAGMENTCOLUMNS = ['StartX', 'EndX', 'StartY', 'EndY']
+
+# Return the fragment columns described by a Fragment, all None if it is not recognised.
+def parse_fragment(fragment):
+    match = FRAGMENTREGEX.match(fragment or '')
+    if match is None:
+        return dict.fromkeys(FRAGMENTCOLUMNS)
+
+    return {column: int(value) if value is not None else None for column, value in zip(FRAGMENTCOLUMNS, match.groups())}
+
+# Return the fragment columns of a tagging, as stored or, for files made by older
+# versions that lack them, parsed from its Fragment.
+def tagging_fragment(tagging):
+    if 'StartX' in tagging.keys() and tagging['StartX'] is not None:
+        return {column: tagging[column] for column in FRAGMENTCOLUMNS}
+
+    return parse_fragment(tagging['Fragment'])
+
+# The fragment columns of a Tagging table that it has, for selecting them
+def fragment_columns(table):
+    return [table.c[column] for column in FRAGMENTCOLUMNS if column in table.c]
+
+# Source objects and thumbnails can be kept out of the Source table, in a Blob table
+# keyed by the SHA-256 hash of their contents, so that reading source metadata does not
+# wade through them and identical blobs are stored once. Source then has ObjectHash and
+# ThumbnailHash columns in place of Object and Thumbnail.
+BLOBCOLUMNS = ['Object', 'Thumbnail']
+
+def blob_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# Return a column of the Source table holding blobs, or where they are kept in the Blob
+# table, an expression that fetches them from it, labelled with the column name.
+def blob_column(source, blob, column):
+    if column in source.c:
+        return source.c[column]
+
+    return select([blob.c.Data]).where(blob.c.Hash == source.c[column + 'Hash']).as_scalar().label(column)
+
+# Move the blobs in rows to be written to the Source table into the Blob table, if that
+# is where they are kept, replacing each by its hash. Rows are changed in place and True
+# returned if anything was moved.
+def store_blobs(con, source, blob, rows):
+    if blob is None or any(column in source.c for column in BLOBCOLUMNS):
+        return False
+
+    blobs = {}
+    for row in rows:
+        for column in BLOBCOLUMNS:
+            if column in row:
+                data = row.pop(column)
+                if data is not None:
+                    data = bytes(data)
+                    row[column + 'Hash'] = blob_hash(data)
+                    blobs[row[column + 'Hash']] = data
+                else:
+                    row[column + 'Hash'] = None
+
+    if blobs:
+        existing = set(row['Hash'] for row in con.execute(select([blob.c.Hash]).where(blob.c.Hash.in_(list(blobs.keys())))))
+        newblobs = [{'Hash': hash, 'Data': data} for hash, data in blobs.items() if hash not in existing]
+        if newblobs:
+            con.execute(blob.insert(), newblobs)
+
+    return True
+
+# Delete blobs that no source refers to any more, returning the number deleted
+def delete_orphan_blobs(con, source, blob):
+    if blob is None:
+        return 0
+
+    referenced = union(*[select([source.c[column + 'Hash']]).where(source.c[column + 'Hash'].isnot(None))
+                         for column in BLOBCOLUMNS if column + 'Hash' in source.c])
+    return con.execute(blob.delete().where(blob.c.Hash.notin_(referenced))).rowcount
+
+# An optional SQLite FTS5 index over the text of sources. It takes its text from the
+# Source table rather than storing a copy and is kept up to date by triggers, so that
+# every tool that changes sources maintains it.
+SOURCETEXT = 'SourceText'
+
+SOURCETEXTTRIGGERS = {
+    'insert': "AFTER INSERT ON Source BEGIN "
+              "INSERT INTO SourceText(rowid, Content) VALUES (new.rowid, new.Content); END",
+    'delete': "AFTER DELETE ON Source BEGIN "
+              "INSERT INTO SourceText(SourceText, rowid, Content) VALUES ('delete', old.rowid, old.Content); END",
+    'update': "AFTER UPDATE OF Content ON Source BEGIN "
+              "INSERT INTO SourceText(SourceText, rowid, Content) VALUES ('delete', old.rowid, old.Content); "
+              "INSERT INTO SourceText(rowid, Content) VALUES (new.rowid, new.Content); END"
+}
+
+def has_source_text_index(con):
+    return con.dialect.has_table(con, SOURCETEXT)
+
+# Whether source text is stored compressed, and so cannot be read by the text index
+def source_text_compressed(con):
+    return any(row['name'] == 'Content' and row['type'].upper() in ['ZLIBTEXT', 'ZSTDTEXT']
+               for row in con.execute("PRAGMA table_info(Source)"))
+
+# Create the source text index if there is none, or otherwise rebuild it, returning
+# whether it was created.
+def create_source_text_index(con, verbosity=1):
+    if has_source_text_index(con):
+        if verbosity > 1:
+            print("Rebuilding index " + SOURCETEXT, file=sys.stderr)
+        con.execute("INSERT INTO " + SOURCETEXT + "(" + SOURCETEXT + ") VALUES ('rebuild')")
+        return False
+
+    if source_text_compressed(con):
+        raise RuntimeError("Source text is compressed and cannot be indexed")
+
+    if verbosity > 1:
+        print("Creating index " + SOURCETEXT, file=sys.stderr)
+    con.execute("CREATE VIRTUAL TABLE " + SOURCETEXT + " USING fts5(Content, content='Source')")
+    for dmlevent, trigger in SOURCETEXTTRIGGERS.items():
+        con.execute("CREATE TRIGGER " + SOURCETEXT + "_" + dmlevent + " " + trigger)
+    con.execute("INSERT INTO " + SOURCETEXT + "(" + SOURCETEXT + ") VALUES ('rebuild')")
+    return True
+
+def drop_source_text_index(con):
+    for dmlevent in SOURCETEXTTRIGGERS.keys():
+        con.execute("DROP TRIGGER IF EXISTS " + SOURCETEXT + "_" + dmlevent)
+    con.execute("DROP TABLE IF EXISTS " + SOURCETEXT)
+
+# Whether a table is part of the source text index rather than an ordinary table
+def is_source_text_table(tablename):
+    return tablename == SOURCETEXT or tablename.startswith(SOURCETEXT + '_')
+
+# SQLite settings applied to each connection, by profile. The bulk profile is for
+# loading data into a file: it keeps the rollback journal in memory, does not wait for
+# writes to reach the disk and holds the file locked until the connection closes, so a
+# crash part way through may leave the file unusable. The read profile is for tools
+# that only query a file.
+SQLITEPROFILES = {
+    'default': [],
+    'bulk':    [('journal_mode', 'MEMORY'),
+                ('synchronous',  'OFF'),
+                ('cache_size',   -262144),
+                ('temp_store',   'MEMORY'),
+                ('locking_mode', 'EXCLUSIVE')],
+    'read':    [('mmap_size',    268435456),
+                ('cache_size',   -65536),
+                ('query_only',   'ON')]
+}
+
+# Apply a SQLite profile to every connection made by an engine. Engines for other
+# databases are left alone.
+def set_sqlite_profile(db, sqliteprofile, exclude=[]):
+    if not sqliteprofile or db.dialect.name != 'sqlite':
+        return
+
+    pragmas = [(name, value) for name, value in SQLITEPROFILES[sqliteprofile] if name not in exclude]
+    if pragmas:
+        @event.listens_for(db, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute('PRAGMA ' + name + ' = ' + str(value))
+            cursor.close()
+
+# Number of rows fetched at a time by the read API of NVivoNorm
+READBATCHSIZE = 1000
+
+class NormRecord(object):
+    """A row read from a normalised file.
+
+    Records are built from rows with their columns as attributes, in slots rather than
+    a dictionary per record, so that iterating over many of them is cheap.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, row, norm=None):
+        for column in self.__slots__:
+            if not column.startswith('_'):
+                setattr(self, column, row[column])
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + ', '.join(column + '=' + repr(getattr(self, column))
+                                                     for column in self.__slots__ if not column.startswith('_')) + ')'
+
+class SourceRecord(NormRecord):
+    """A source. Its object and thumbnail are read from the file when the attributes
+    are used, each time they are used, rather than with the source.
+
+    """
+    __slots__ = ('Id', 'Category', 'Name', 'Description', 'Color', 'Content', 'ObjectType', 'SourceType',
+                 'CreatedBy', 'CreatedDate', 'ModifiedBy', 'ModifiedDate', '_norm')
+
+    def __init__(self, row, norm):
+        super(SourceRecord, self).__init__(row)
+        self._norm = norm
+
+    def blob(self, column):
+        norm = self._norm
+        return norm.con.execute(select([norm.blobcolumn(column)]).where(norm.Source.c.Id == bindparam('Id')), {'Id': self.Id}).scalar()
+
+    @property
+    def Object(self):
+        return self.blob('Object')
+
+    @property
+    def Thumbnail(self):
+        return self.blob('Thumbnail')
+
+class NodeRecord(NormRecord):
+    __slots__ = ('Id', 'Parent', 'Category', 'Name', 'Description', 'Color', 'Aggregate',
+                 'CreatedBy', 'CreatedDate', 'ModifiedBy', 'ModifiedDate')
+
+class TaggingRecord(NormRecord):
+    """A tagging, or an annotation if it has no node. The fragment columns are filled
+    in from the Fragment for files that do not store them.
+
+    """
+    __slots__ = ('Id', 'Source', 'Node', 'Fragment', 'StartX', 'EndX', 'StartY', 'EndY', 'Memo',
+                 'CreatedBy', 'CreatedDate', 'ModifiedBy', 'ModifiedDate')
+
+    # Columns other than the fragment columns, which are always read as they are
+    PLAINCOLUMNS = ('Id', 'Source', 'Node', 'Fragment', 'Memo',
+                    'CreatedBy', 'CreatedDate', 'ModifiedBy', 'ModifiedDate')
+
+    def __init__(self, row, norm):
+        for column in TaggingRecord.PLAINCOLUMNS:
+            setattr(self, column, row[column])
+        try:
+            startx = row['StartX']
+        except KeyError:
+            startx = None
+        if startx is not None:
+            self.StartX = startx
+            self.EndX   = row['EndX']
+            self.StartY = row['StartY']
+            self.EndY   = row['EndY']
+        else:
+            fragment = parse_fragment(row['Fragment'])
+            self.StartX = fragment['StartX']
+            self.EndX   = fragment['EndX']
+            self.StartY = fragment['StartY']
+            self.EndY   = fragment['EndY']
 
 class NVivoNorm(object):
 
-    def __init__(self, path):
+    # Indexes on tables created by a new NVivoNorm are normally created with the tables.
+    # With deferindexes they are instead created by commit(), so that a bulk load into
+    # a new file does not pay for maintaining them row by row.
+    #
+    # Everything is done through a single connection so that the exclusive lock held
+    # under the bulk profile does not block it.
+    #
+    # With binaryuuids a new file stores UUIDs as 16 byte BLOBs rather than strings, and
+    # with blobtable it keeps source objects and thumbnails in the Blob table. With
+    # compress, one of the codecs in COMPRESSEDTYPES, it stores source objects and text
+    # compressed.
+    def __init__(self, path, deferindexes=False, sqliteprofile=None, binaryuuids=False, blobtable=False, compress=None):
+        self.deferindexes = deferindexes
+        self.blobschanged = False
+        created = []
+        uuidtype = BinaryUUID if binaryuuids else UUID
+        if compress:
+            objecttype, contenttype = COMPRESSEDTYPES[compress]
+        else:
+            objecttype, contenttype = LargeBinary, lambda: UnicodeText(16384)
         try:
-            self.db  = create_engine('sqlite:///' + path)
-            self.md  = MetaData(bind=self.db)
+            self.db  = profile(create_engine('sqlite:///' + path))
+            # Tables may need to be created, so the file becomes read-only further down
+            set_sqlite_profile(self.db, sqliteprofile, exclude=['query_only'])
             self.con = self.db.connect()
+            self.md  = MetaData(bind=self.con)
             self.tr  = None
         except:
             raise
@@ -39,9 +346,13 @@ class NVivoNorm(object):
             self.User = Table('User', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.User = Table('User', self.md,
-                Column('Id',            UUID(),         primary_key=True),
+                Column('Id',            uuidtype(),     primary_key=True),
                 Column('Name',          UnicodeText(256)))
-            self.User.create(self.db)
+            self.User.create(self.con)
+            created.append('User')
+
+        # Any new tables store UUIDs the same way as the existing ones
+        uuidtype = type(self.User.c.Id.type)
 
         try:
             self.Project = Table('Project', self.md, autoload=True)
@@ -50,160 +361,215 @@ class NVivoNorm(object):
                 Column('Version',       UnicodeText(16)),
                 Column('Title',         UnicodeText(256),                            nullable=False),
                 Column('Description',   UnicodeText(2048)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id"),  nullable=False),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id"),  nullable=False),
                 Column('CreatedDate',   DateTime,                               nullable=False),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id"),  nullable=False),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id"),  nullable=False),
                 Column('ModifiedDate',  DateTime,                               nullable=False))
-            self.Project.create(self.db)
+            self.Project.create(self.con)
+            created.append('Project')
 
         try:
             self.NodeCategory = Table('NodeCategory', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.NodeCategory = Table('NodeCategory', self.md,
-                Column('Id',            UUID(),         primary_key=True),
+                Column('Id',            uuidtype(),     primary_key=True),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.NodeCategory.create(self.db)
+            self.NodeCategory.create(self.con)
+            created.append('NodeCategory')
 
         try:
             self.Node = Table('Node', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.Node = Table('Node', self.md,
-                Column('Id',            UUID(),         primary_key=True),
-                Column('Parent',        UUID(),         ForeignKey("Node.Id")),
-                Column('Category',      UUID(),         ForeignKey("NodeCategory.Id")),
+                Column('Id',            uuidtype(),     primary_key=True),
+                Column('Parent',        uuidtype(),     ForeignKey("Node.Id")),
+                Column('Category',      uuidtype(),     ForeignKey("NodeCategory.Id")),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
                 Column('Color',         Integer),
                 Column('Aggregate',     Boolean),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.Node.create(self.db)
+            self.Node.create(self.con)
+            created.append('Node')
 
         try:
             self.NodeAttribute = Table('NodeAttribute', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.NodeAttribute = Table('NodeAttribute', self.md,
-                Column('Id',            UUID(),         primary_key=True),
+                Column('Id',            uuidtype(),     primary_key=True),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
                 Column('Type',          UnicodeText(16)),
                 Column('Length',        Integer),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.NodeAttribute.create(self.db)
+            self.NodeAttribute.create(self.con)
+            created.append('NodeAttribute')
 
         try:
             self.NodeValue = Table('NodeValue', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.NodeValue = Table('NodeValue', self.md,
-                Column('Node',          UUID(),         ForeignKey("Node.Id"),      primary_key=True),
-                Column('Attribute',     UUID(),         ForeignKey("NodeAttribute.Id"),
+                Column('Node',          uuidtype(),     ForeignKey("Node.Id"),      primary_key=True),
+                Column('Attribute',     uuidtype(),     ForeignKey("NodeAttribute.Id"),
                                                                                     primary_key=True),
                 Column('Value',         UnicodeText(256)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.NodeValue.create(self.db)
+            self.NodeValue.create(self.con)
+            created.append('NodeValue')
 
         try:
             self.SourceCategory = Table('SourceCategory', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.SourceCategory = Table('SourceCategory', self.md,
-                Column('Id',            UUID(),         primary_key=True),
+                Column('Id',            uuidtype(),     primary_key=True),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.SourceCategory.create(self.db)
+            self.SourceCategory.create(self.con)
+            created.append('SourceCategory')
+
+        try:
+            self.Blob = Table('Blob', self.md, autoload=True)
+        except exc.NoSuchTableError:
+            self.Blob = None
+            if blobtable and not self.con.dialect.has_table(self.con, 'Source'):
+                self.Blob = Table('Blob', self.md,
+                    Column('Hash',          String(64),     primary_key=True),
+                    Column('Data',          objecttype()))
+                self.Blob.create(self.con)
+                created.append('Blob')
 
         try:
             self.Source = Table('Source', self.md, autoload=True)
         except exc.NoSuchTableError:
+            if self.Blob is not None:
+                blobcolumns = [Column('ObjectHash',     String(64),     ForeignKey("Blob.Hash")),
+                               Column('ThumbnailHash',  String(64),     ForeignKey("Blob.Hash"))]
+            else:
+                blobcolumns = [Column('Object',         objecttype()),
+                               Column('Thumbnail',      LargeBinary)]
             self.Source = Table('Source', self.md,
-                Column('Id',            UUID(),         primary_key=True),
-                Column('Category',      UUID(),         ForeignKey("SourceCategory.Id")),
+                Column('Id',            uuidtype(),     primary_key=True),
+                Column('Category',      uuidtype(),     ForeignKey("SourceCategory.Id")),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
                 Column('Color',         Integer),
-                Column('Content',       UnicodeText(16384)),
+                Column('Content',       contenttype()),
                 Column('ObjectType',    UnicodeText(256)),
                 Column('SourceType',    Integer),
-                Column('Object',        LargeBinary),
-                Column('Thumbnail',     LargeBinary),
+                *blobcolumns,
             #Column('Waveform',      LargeBinary,    nullable=False),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.Source.create(self.db)
+            self.Source.create(self.con)
+            created.append('Source')
 
         try:
             self.SourceAttribute = Table('SourceAttribute', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.SourceAttribute = Table('SourceAttribute', self.md,
-                Column('Id',            UUID(),         primary_key=True),
+                Column('Id',            uuidtype(),     primary_key=True),
                 Column('Name',          UnicodeText(256)),
                 Column('Description',   UnicodeText(512)),
                 Column('Type',          UnicodeText(16)),
                 Column('Length',        Integer),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.SourceAttribute.create(self.db)
+            self.SourceAttribute.create(self.con)
+            created.append('SourceAttribute')
 
         try:
             self.SourceValue = Table('SourceValue', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.SourceValue = Table('SourceValue', self.md,
-                Column('Source',        UUID(),         ForeignKey("Source.Id"),    primary_key=True),
-                Column('Attribute',     UUID(),         ForeignKey("SourceAttribute.Id"),
+                Column('Source',        uuidtype(),     ForeignKey("Source.Id"),    primary_key=True),
+                Column('Attribute',     uuidtype(),     ForeignKey("SourceAttribute.Id"),
                                                                                     primary_key=True),
                 Column('Value',         UnicodeText(256)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.SourceValue.create(self.db)
+            self.SourceValue.create(self.con)
+            created.append('SourceValue')
 
         try:
             self.Tagging = Table('Tagging', self.md, autoload=True)
         except exc.NoSuchTableError:
             self.Tagging = Table('Tagging', self.md,
-                Column('Id',            UUID(),         primary_key=True),
-                Column('Source',        UUID(),         ForeignKey("Source.Id")),
-                Column('Node',          UUID(),         ForeignKey("Node.Id")),
+                Column('Id',            uuidtype(),     primary_key=True),
+                Column('Source',        uuidtype(),     ForeignKey("Source.Id")),
+                Column('Node',          uuidtype(),     ForeignKey("Node.Id")),
                 Column('Fragment',      UnicodeText(256)),
+                Column('StartX',        Integer),
+                Column('EndX',          Integer),
+                Column('StartY',        Integer),
+                Column('EndY',          Integer),
                 Column('Memo',          UnicodeText(256)),
-                Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
+                Column('CreatedBy',     uuidtype(),     ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
-                Column('ModifiedBy',    UUID(),         ForeignKey("User.Id")),
+                Column('ModifiedBy',    uuidtype(),     ForeignKey("User.Id")),
                 Column('ModifiedDate',  DateTime))
-            self.Tagging.create(self.db)
+            self.Tagging.create(self.con)
+            created.append('Tagging')
+
+        # Indexes missing from an existing file, such as one made by an older version, are
+        # left to upgradeNorm, rather than built here outside the caller's transaction.
+        if created and not deferindexes:
+            self.createindexes(created)
+
+        if ('query_only', 'ON') in SQLITEPROFILES.get(sqliteprofile or 'default'):
+            self.con.execute('PRAGMA query_only = ON')
 
     def __del__(self):
+        # At exit the underlying connection may already be gone, leaving nothing to roll back
+        try:
+            self.close()
+        except exc.DBAPIError:
+            pass
+
+    # Release the file, which under the bulk profile stays locked until the connection
+    # is closed. Use this rather than relying on the object being deleted.
+    def close(self):
         if self.tr:
             self.tr.rollback()
-        #self.con.close()
-        self.db.dispose()
+            self.tr = None
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+            self.db.dispose()
 
     def begin(self):
         self.tr  = self.con.begin()
 
     def commit(self):
         if self.tr:
+            if self.deferindexes:
+                self.createindexes()
+            if self.blobschanged:
+                delete_orphan_blobs(self.con, self.Source, self.Blob)
+                self.blobschanged = False
             self.tr.commit()
             self.tr = None
 
@@ -211,3 +577,66 @@ class NVivoNorm(object):
         if self.tr:
             self.tr.rollback()
             self.tr = None
+
+    def createindexes(self, tablenames=None, verbosity=1):
+        return create_norm_indexes(self.md, self.con, tablenames, verbosity)
+
+    # Return an expression for a source blob column, wherever the blobs are kept
+    def blobcolumn(self, column):
+        return blob_column(self.Source, self.Blob, column)
+
+    # Prepare rows to be written to the Source table, as store_blobs above
+    def storeblobs(self, rows):
+        if store_blobs(self.con, self.Source, self.Blob, rows):
+            self.blobschanged = True
+
+    # Fetch a blob by its hash, for sources read without their blobs
+    def getblob(self, hash):
+        if hash is None:
+            return None
+        return self.con.execute(select([self.Blob.c.Data]).where(self.Blob.c.Hash == bindparam('Hash')), {'Hash': hash}).scalar()
+
+    # Yield records of a class built from the rows selected, fetched in batches
+    def records(self, recordclass, sel, params={}):
+        rows = self.con.execute(sel, params)
+        while True:
+            batch = rows.fetchmany(READBATCHSIZE)
+            if not batch:
+                break
+            for row in batch:
+                yield recordclass(row, self)
+
+    # Add a condition to a selection matching an Id, or given anything else, a name in
+    # another table joined by that Id.
+    def selectby(self, sel, params, column, value, nametable):
+        if value is None:
+            return sel
+        params[column.name] = value
+        if isinstance(value, uuid.UUID):
+            return sel.where(column == bindparam(column.name))
+        return sel.where(and_(column == nametable.c.Id,
+                              nametable.c.Name == bindparam(column.name)))
+
+    # Iterate over sources, optionally those of a category given by Id or name
+    def sources(self, category=None):
+        params = {}
+        sel = select([self.Source.c[column] for column in SourceRecord.__slots__ if column in self.Source.c])
+        sel = self.selectby(sel, params, self.Source.c.Category, category, self.SourceCategory)
+        return self.records(SourceRecord, sel, params)
+
+    # Iterate over nodes, optionally those of a category given by Id or name
+    def nodes(self, category=None):
+        params = {}
+        sel = select([self.Node.c[column] for column in NodeRecord.__slots__])
+        sel = self.selectby(sel, params, self.Node.c.Category, category, self.NodeCategory)
+        return self.records(NodeRecord, sel, params)
+
+    # Iterate over taggings and annotations, optionally those of a source and/or node
+    # given by Id or name, ordered by source and, where the file stores them, position.
+    def taggings(self, source=None, node=None):
+        params = {}
+        sel = select([self.Tagging.c[column] for column in TaggingRecord.__slots__ if column in self.Tagging.c])
+        sel = self.selectby(sel, params, self.Tagging.c.Source, source, self.Source)
+        sel = self.selectby(sel, params, self.Tagging.c.Node, node, self.Node)
+        sel = sel.order_by(self.Tagging.c.Source, *fragment_columns(self.Tagging)[:2])
+        return self.records(TaggingRecord, sel, params)
@@ -26,6 +26,18 @@ parser.add_argument('-m', '--mac',  action='store_true',
                     help='Use NVivo for Mac database format.')
 
 parser.add_argument('-v', '--verbosity', type=int, default=1)
+parser.add_argument('--batch-size', type=int, default=1000,
+                    help='Number of rows per bulk database statement; also bounds the number of sources held in memory.')
+parser.add_argument('--stats-file', type=str,
+                    help='Write per-phase timing, row count and memory statistics to this JSON file.')
+parser.add_argument('--sqlite-profile', choices=["default", "bulk"], default="bulk",
+                    help='SQLite settings for the normalised file; bulk favours loading speed over safety from crashes.')
+parser.add_argument('--binary-uuids', action='store_true',
+                    help='Store UUIDs in a new normalised file as 16 byte binary values rather than text.')
+parser.add_argument('--blob-table', action='store_true',
+                    help='Keep source objects and thumbnails of a new normalised file in a separate table, storing identical ones once.')
+parser.add_argument('--compress', choices=["zlib", "zstd"],
+                    help='Store source objects and text in a new normalised file compressed; zstd needs the zstandard module.')
 
 parser.add_argument('-nv', '--nvivoversion', choices=["10", "11"], default="10",
                     help='NVivo version (10 or 11)')
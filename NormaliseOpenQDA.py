@@ -22,14 +22,13 @@ from sqlalchemy import *
 from sqlalchemy import exc
 import warnings
 import sys
-import os
 import argparse
 import uuid
 import datetime
 import urllib2
 import webcolors
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 try:
     parser = argparse.ArgumentParser(description='Normalise an offloaded NVivo project.')
@@ -128,6 +127,10 @@ try:
             Column('Source',        UUID(),         ForeignKey("Source.Id")),
             Column('Node',          UUID(),         ForeignKey("Node.Id")),
             Column('Fragment',      String(256)),
+            Column('StartX',        Integer),
+            Column('EndX',          Integer),
+            Column('StartY',        Integer),
+            Column('EndY',          Integer),
             Column('Memo',          String(256)),
             Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
             Column('CreatedDate',   DateTime),
@@ -358,6 +361,10 @@ try:
         taggings  = [dict(row) for row in oqdadb.execute(sel)]
         for tagging in taggings:
             tagging['Fragment']     = str(tagging['x1']) + ':' + str(tagging['x2']) + ',' + str(tagging['y1']) + ':' + str(tagging['y2'])
+            tagging['StartX']       = tagging['x1']
+            tagging['EndX']         = tagging['x2']
+            tagging['StartY']       = tagging['y1']
+            tagging['EndY']         = tagging['y2']
             tagging['Source']       = sourceuuid[tagging['images_id']]
             tagging['Node']         = codeuuid[tagging['codes_id']]
             tagging['CreatedBy']    = users[tagging['owner']]
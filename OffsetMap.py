@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain
+
+# Return an array whose i'th element is the number of true flags before index i.
+def prefixcounts(flags):
+    return array('l', accumulate(chain((0,), flags)))
+
+class OffsetMap(object):
+    """Translates text offsets of one source between the conventions used by NVivo.
+
+    NVivo for Mac tagging offsets (StartText/LengthText) count only characters that are
+    not white space, although non-breaking spaces are counted, while StartX/LengthX
+    count all characters. NVivo for Windows stores text with two-character line
+    terminators. Prefix counts of each kind of character are built the first time they
+    are needed, after which each translation takes at most a binary search, rather than
+    a scan of the text.
+
+    Counts over a range behave exactly as the equivalent count over a slice of the text.
+    """
+
+    def __init__(self, text):
+        self.text   = text
+        self.length = len(text)
+        self._whitespace    = None
+        self._nonwhitespace = None
+        self._crlfs         = None
+        self._lonelfs       = None
+
+    # Number of white space characters, not counting non-breaking spaces, in text[0:i]
+    @property
+    def whitespace(self):
+        if self._whitespace is None:
+            self._whitespace = prefixcounts(c.isspace() and c != u'\xa0' for c in self.text)
+        return self._whitespace
+
+    # Number of other characters in text[0:i]
+    @property
+    def nonwhitespace(self):
+        if self._nonwhitespace is None:
+            self._nonwhitespace = array('l', (i - count for i, count in enumerate(self.whitespace)))
+        return self._nonwhitespace
+
+    # Number of '\r\n' sequences starting in text[0:i]
+    @property
+    def crlfs(self):
+        if self._crlfs is None:
+            self._crlfs = prefixcounts(c == '\r' and n == '\n' for c, n in zip(self.text, chain(self.text[1:], ' ')))
+        return self._crlfs
+
+    # Number of '\n' not preceded by '\r' in text[0:i]
+    @property
+    def lonelfs(self):
+        if self._lonelfs is None:
+            self._lonelfs = prefixcounts(c == '\n' and p != '\r' for p, c in zip(chain('\r', self.text), self.text))
+        return self._lonelfs
+
+    def span(self, start, end):
+        start, end, step = slice(start, end).indices(self.length)
+        return start, max(start, end)
+
+    def count_whitespace(self, start, end):
+        start, end = self.span(start, end)
+        return self.whitespace[end] - self.whitespace[start]
+
+    def count_crlfs(self, start, end):
+        start, end = self.span(start, end)
+        return self.crlfs[end-1] - self.crlfs[start] if end - 1 > start else 0
+
+    # A line feed at the start of the range is not counted since the character that
+    # precedes it is outside the range.
+    def count_lonelfs(self, start, end):
+        start, end = self.span(start, end)
+        return self.lonelfs[end] - self.lonelfs[start+1] if end > start + 1 else 0
+
+    # Convert Mac StartText/LengthText to StartX/LengthX
+    def text_to_x(self, starttext, lengthtext):
+        nonwhitespace = self.nonwhitespace
+        if starttext < nonwhitespace[self.length]:
+            startx = bisect_left(nonwhitespace, starttext + 1) - 1
+        else:
+            startx = starttext + self.whitespace[self.length]
+
+        if startx >= self.length:
+            lengthx = lengthtext
+        elif nonwhitespace[startx] + lengthtext <= nonwhitespace[self.length]:
+            lengthx = bisect_left(nonwhitespace, nonwhitespace[startx] + lengthtext, startx) - startx
+        else:
+            lengthx = lengthtext + self.whitespace[self.length] - self.whitespace[startx]
+
+        return startx, lengthx
+
+    # Convert Mac StartX/LengthX to StartText/LengthText
+    def x_to_text(self, startx, lengthx):
+        return (startx  - self.count_whitespace(0, startx),
+                lengthx - self.count_whitespace(startx, startx + lengthx))
+
+    # Convert Windows StartX/LengthX over text with '\r\n' line terminators to offsets
+    # over the same text with '\n' line terminators.
+    def crlf_to_lf(self, startx, lengthx):
+        return (startx  - self.count_crlfs(0, startx),
+                lengthx - self.count_crlfs(startx - 1, startx + lengthx - 1))
+
+    # Convert offsets over text with '\n' line terminators to Windows StartX/LengthX
+    # over the same text with '\r\n' line terminators.
+    def lf_to_crlf(self, startx, lengthx):
+        return (startx  + self.count_lonelfs(0, startx),
+                lengthx + self.count_lonelfs(startx, startx + lengthx))
@@ -19,14 +19,20 @@
 from __future__ import print_function
 from sqlalchemy import *
 from sqlalchemy import exc
-import os
 import sys
-import re
 from datetime import date, time, datetime
 from dateutil import parser as dateparser
-from distutils import util
+from Stats import profile
+from Schema import load_schema
+from NVivoNorm import create_norm_indexes, set_sqlite_profile, parse_fragment, tagging_fragment, fragment_columns
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
+
+# Tables read from or written to RQDA and normalised databases
+RQDATABLES = ['project', 'source', 'fileAttr', 'filecat', 'annotation', 'attributes', 'caseAttr', 'caselinkage',
+              'cases', 'codecat', 'coding', 'freecode', 'journal', 'treecode', 'treefile']
+NORMTABLES = ['User', 'Project', 'NodeCategory', 'Node', 'NodeAttribute', 'NodeValue',
+              'SourceCategory', 'Source', 'SourceAttribute', 'SourceValue', 'Tagging']
 
 def Norm2RQDA(args):
     # Initialise DB variables so exception handlers don't freak out
@@ -35,9 +41,8 @@ def Norm2RQDA(args):
     rqdatr = None
 
     try:
-        normdb = create_engine(args.indb)
-        normmd = MetaData(bind=normdb)
-        normmd.reflect(normdb)
+        normdb = profile(create_engine(args.indb))
+        normmd = load_schema(normdb, verbosity=args.verbosity)
 
         normUser            = normmd.tables.get('User')
         normProject         = normmd.tables.get('Project')
@@ -55,9 +60,8 @@ def Norm2RQDA(args):
             args.outdb = args.indb.rsplit('.',1)[0] + '.rqda'
 
 
-        rqdadb = create_engine(args.outdb)
-        rqdamd = MetaData(bind=rqdadb)
-        rqdamd.reflect(rqdadb)
+        rqdadb = profile(create_engine(args.outdb))
+        rqdamd = load_schema(rqdadb, versiontable='project', versioncolumn='databaseversion', verbosity=args.verbosity)
 
 # Create the RQDA database structure if it doesn't already exist
         rqdaproject = rqdamd.tables.get('project')
@@ -408,7 +412,7 @@ def Norm2RQDA(args):
                 value['value'] = time.strftime(dateparser.parse(value['value']).time(), '%H%M%S')
             elif value['Type'] == 'Boolean':
                 attrclass = 'numeric'
-                value['value'] = util.strtobool(value['value'])
+                value['value'] = strtobool(value['value'])
 
             attribute = rqdacon.execute(select([
                     rqdaattributes.c['class']
@@ -639,7 +643,7 @@ def Norm2RQDA(args):
                     normUser.c.Name.label('owner'),
                     normTagging.c.CreatedDate,
                     normTagging.c.ModifiedDate
-                ]).where(and_(
+                ] + fragment_columns(normTagging)).where(and_(
                     normSource.c.Id == normTagging.c.Source,
                     normSource.c.Content.isnot(None),
                     normUser.c.Id == normTagging.c.CreatedBy
@@ -652,28 +656,28 @@ def Norm2RQDA(args):
                 tagging['date']   = tagging['CreatedDate']. strftime('%c')
                 tagging['dateM']  = tagging['ModifiedDate'].strftime('%c')
                 tagging['status'] = 1
-                matchfragment = re.match("([0-9]+):([0-9]+)(?:,([0-9]+)(?::([0-9]+))?)?", tagging['Fragment'])
-                if matchfragment is None:
+                fragment = tagging_fragment(tagging)
+                if fragment['StartX'] is None:
                     print("WARNING: Unrecognised tagging fragment: " + tagging['Fragment'] + " for Source: " + sourcename[tagging['SourceUuid']], file=sys.stderr)
                     continue
 
                 if tagging['Node'] is None:
                     tagging['annotation'] = tagging['memo']
                     tagging['fid']        = sourceid[tagging['SourceUuid']]
-                    tagging['position']   = int(matchfragment.group(1))
+                    tagging['position']   = fragment['StartX']
                     annotations += [tagging]
                 elif tagging['Node'] in codeid.keys():
                     tagging['cid']      = codeid[tagging['Node']]
                     tagging['fid']      = sourceid[tagging['SourceUuid']]
-                    tagging['selfirst'] = int(matchfragment.group(1))
-                    tagging['selend']   = int(matchfragment.group(2))
+                    tagging['selfirst'] = fragment['StartX']
+                    tagging['selend']   = fragment['EndX']
                     tagging['seltext']  = sourcetext[tagging['SourceUuid']][tagging['selfirst']:tagging['selend']+1]
                     codings += [tagging]
                 else:
                     tagging['caseid']   = caseid[tagging['Node']]
                     tagging['fid']      = sourceid[tagging['SourceUuid']]
-                    tagging['selfirst'] = int(matchfragment.group(1))
-                    tagging['selend']   = int(matchfragment.group(2))
+                    tagging['selfirst'] = fragment['StartX']
+                    tagging['selend']   = fragment['EndX']
                     caselinkages += [tagging]
 
             if len(annotations) > 0:
@@ -708,8 +712,8 @@ def RQDA2Norm(args):
 
     try:
         if args.indb != '-':
-            rqdadb = create_engine(args.indb)
-            rqdamd = MetaData(bind=rqdadb)
+            rqdadb = profile(create_engine(args.indb))
+            rqdamd = load_schema(rqdadb, RQDATABLES, versiontable='project', versioncolumn='databaseversion', verbosity=args.verbosity)
 
             rqdaproject     = Table('project',     rqdamd, autoload=True)
             rqdasource      = Table('source',      rqdamd, autoload=True)
@@ -731,8 +735,9 @@ def RQDA2Norm(args):
 
         if args.outdb is None:
             args.outdb = args.indb.rsplit('.',1)[0] + '.norm'
-        normdb = create_engine(args.outdb)
-        normmd = MetaData(bind=normdb)
+        normdb = profile(create_engine(args.outdb))
+        set_sqlite_profile(normdb, getattr(args, 'sqlite_profile', None) or 'bulk')
+        normmd = load_schema(normdb, optional=NORMTABLES, verbosity=args.verbosity)
 
 # Create the normalised database structure
         try:
@@ -888,6 +893,10 @@ def RQDA2Norm(args):
                 Column('Source',        UUID(),         ForeignKey("Source.Id")),
                 Column('Node',          UUID(),         ForeignKey("Node.Id")),
                 Column('Fragment',      String(256)),
+                Column('StartX',        Integer),
+                Column('EndX',          Integer),
+                Column('StartY',        Integer),
+                Column('EndY',          Integer),
                 Column('Memo',          String(256)),
                 Column('CreatedBy',     UUID(),         ForeignKey("User.Id")),
                 Column('CreatedDate',   DateTime),
@@ -1328,6 +1337,7 @@ def RQDA2Norm(args):
                 tagging['Id']           = uuid.uuid4()
                 tagging['Source']       = sourceuuid[tagging['fid']]
                 tagging['Fragment']     = str(int(tagging['StartX'])) + ':' + str(int(tagging['EndX']))
+                tagging.update(parse_fragment(tagging['Fragment']))
                 tagging['CreatedBy']    = find_or_create_user(tagging['owner'])
                 tagging['CreatedDate']  = dateparser.parse(tagging['date'])
                 tagging['ModifiedBy']   = tagging['CreatedBy']
@@ -1336,6 +1346,9 @@ def RQDA2Norm(args):
             if len(taggings) > 0:
                 normcon.execute(normTagging.insert(), taggings)
 
+# Indexes are created once the data is loaded so that they are not maintained row by row.
+        create_norm_indexes(normmd, normcon, verbosity=args.verbosity)
+
 # All done.
         normtr.commit()
         normtr = None
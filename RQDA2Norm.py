@@ -26,6 +26,8 @@ import tempfile
 parser = argparse.ArgumentParser(description='Convert an RQDA project to normalised NVivo format.')
 
 parser.add_argument('-v', '--verbosity', type=int, default=1)
+parser.add_argument('--sqlite-profile', choices=["default", "bulk"], default="bulk",
+                    help='SQLite settings for the normalised file; bulk favours loading speed over safety from crashes.')
 
 parser.add_argument('-u', '--users', choices=["skip", "overwrite"], default="merge",
                     help='User action.')
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import os
+import sys
+import io
+import pickle
+import sqlalchemy
+from sqlalchemy import MetaData, Table, select, text, exc
+from sqlalchemy.sql import table, column
+from Cache import Cache
+import DataTypes
+
+# Version of the snapshot format, which forms part of the key of cached schemas. Change
+# this when the way snapshots are made changes.
+SCHEMAVERSION = 1
+
+SCHEMADIR  = os.path.join(os.path.expanduser('~'), '.nvivotools', 'schema')
+SCHEMASIZE = 64*1048576
+
+class SchemaPickler(pickle.Pickler):
+    """Pickles the types found by reflection by their name in the dialect.
+
+    Types are recorded by the name that the dialect maps to them rather than by module
+    and name, so that loading a snapshot resolves them just as reflection would,
+    including the types that DataTypes adds to the dialect, wherever they are defined.
+    """
+
+    def __init__(self, file, dialect):
+        super(SchemaPickler, self).__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.typenames = {id(cls): name for name, cls in dialect.ischema_names.items()}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, type):
+            return self.typenames.get(id(obj))
+        return None
+
+class SchemaUnpickler(pickle.Unpickler):
+    def __init__(self, file, dialect):
+        super(SchemaUnpickler, self).__init__(file)
+        self.dialect = dialect
+
+    def persistent_load(self, pid):
+        cls = self.dialect.ischema_names.get(pid)
+        if cls is None:
+            raise pickle.UnpicklingError("Unknown type " + pid)
+        return cls
+
+# Return the version recorded in a database, or None if there is none.
+def schema_version(db, versiontable, versioncolumn):
+    try:
+        return db.execute(select([column(versioncolumn)]).select_from(table(versiontable))).scalar()
+    except exc.DBAPIError:
+        return None
+
+# Return the names under which DataTypes registers its types with the dialect of a
+# database. Importing DataTypes here registers them for every tool that reflects a schema,
+# so that a snapshot is never taken without them.
+def schema_types(db):
+    return sorted(name for name, cls in db.dialect.ischema_names.items() if cls.__module__ == DataTypes.__name__)
+
+# Return the table definitions of a SQLite database, which are cheap to read and which
+# distinguish schemas that match by column names, such as those with different types.
+def schema_signature(db):
+    if db.dialect.name != 'sqlite':
+        return None
+    return sorted(tuple(row) for row in db.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'table'")))
+
+# Check that a schema snapshot still describes the database. This costs one query per
+# table rather than the several needed to reflect each one.
+def schema_matches(db, md, tablenames, optional):
+    if tablenames is None and optional is None:
+        if set(db.table_names()) != set(md.tables.keys()):
+            return False
+        tablenames = list(md.tables.keys())
+
+    try:
+        for tablename in (tablenames or []) + [tablename for tablename in optional or [] if tablename in md.tables]:
+            result = db.execute(select([text('*')]).select_from(md.tables[tablename]).where(text('1 = 0')))
+            columns = result.keys()
+            result.close()
+            if set(columns) != set(md.tables[tablename].c.keys()):
+                return False
+
+        with db.connect() as con:
+            for tablename in optional or []:
+                if tablename not in md.tables and db.dialect.has_table(con, tablename):
+                    return False
+    except exc.DBAPIError:
+        return False
+
+    return True
+
+# Return bound metadata describing the given tables of a database, or all of its tables
+# if none are given. Tables in tablenames must exist, those in optional may not. The
+# metadata is loaded from a snapshot taken the last time a database of the same dialect
+# and version was reflected, and only reflected again if the snapshot does not match.
+def load_schema(db, tablenames=None, optional=None, versiontable='Project', versioncolumn='Version', verbosity=1):
+    version = schema_version(db, versiontable, versioncolumn)
+    if version is not None:
+        cache = Cache(SCHEMADIR, SCHEMASIZE)
+        key = cache.key(str(version).encode('utf-8'), SCHEMAVERSION, sqlalchemy.__version__,
+                        db.dialect.name, db.dialect.server_version_info, schema_types(db), schema_signature(db),
+                        tablenames, optional, versiontable, versioncolumn)
+        data = cache.get(key)
+        if data is not None:
+            try:
+                md = SchemaUnpickler(io.BytesIO(data), db.dialect).load()
+            except Exception:
+                md = None
+
+            if md is not None and schema_matches(db, md, tablenames, optional):
+                if verbosity > 1:
+                    print("Using cached schema for " + db.dialect.name + " version " + str(version), file=sys.stderr)
+                md.bind = db
+                return md
+
+    if verbosity > 1:
+        print("Reflecting schema of " + db.dialect.name + " database", file=sys.stderr)
+    md = MetaData(bind=db)
+    if tablenames is None and optional is None:
+        md.reflect(db)
+    else:
+        for tablename in tablenames or []:
+            Table(tablename, md, autoload=True)
+        for tablename in optional or []:
+            try:
+                Table(tablename, md, autoload=True)
+            except exc.NoSuchTableError:
+                pass
+
+    if version is not None:
+        data = io.BytesIO()
+        SchemaPickler(data, db.dialect).dump(md)
+        cache.put(key, data.getvalue())
+
+    return md
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import sys
+import os
+import re
+import time
+import json
+import atexit
+from sqlalchemy import event
+
+try:
+    import resource
+except ImportError:     # Not available on Windows
+    resource = None
+
+# Peak resident memory of this process in bytes, or None if it cannot be determined.
+def peakmemory():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+class Stats(object):
+    """Per-phase instrumentation for conversions.
+
+    Records wall time, rows read, rows written, SQL statements issued and peak memory
+    for each named phase. Statements and rows written are counted by SQLAlchemy event
+    hooks on the attached engines; rows read are reported by the caller.
+    """
+
+    # Minimum interval in seconds between progress reports
+    PROGRESSINTERVAL = 1.0
+
+    def __init__(self, name, verbosity=1):
+        self.name      = name
+        self.verbosity = verbosity
+        self.phases    = []
+        self.current   = None
+        self.starttime = time.time()
+        self.lastprogress = 0
+        self.progressshown = False
+
+    def attach(self, engine, output=False):
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if self.current is None:
+                return
+            self.current['Statements'] += 1
+            if output and (context.isinsert or context.isupdate or context.isdelete):
+                if executemany:
+                    self.current['RowsWritten'] += len(parameters)
+                elif cursor.rowcount > 0:
+                    self.current['RowsWritten'] += cursor.rowcount
+
+    # Begin a new phase, ending the current phase if there is one.
+    def phase(self, name, operation=None):
+        self.end()
+        if sqlprofiler is not None:
+            sqlprofiler.phase(name)
+        self.current = {
+                'Phase':       name,
+                'Operation':   operation,
+                'Start':       time.time(),
+                'Seconds':     None,
+                'RowsRead':    0,
+                'RowsWritten': 0,
+                'Statements':  0,
+                'PeakMemory':  None
+            }
+        self.lastprogress = self.current['Start']
+        self.progressshown = False
+
+    def end(self):
+        if self.current is not None:
+            self.current['Seconds']    = time.time() - self.current['Start']
+            self.current['PeakMemory'] = peakmemory()
+            del self.current['Start']
+            # End the progress line, if one was shown
+            if self.progressshown:
+                print('', file=sys.stderr)
+            self.phases.append(self.current)
+            self.current = None
+
+    def read(self, rows):
+        if self.current is not None:
+            self.current['RowsRead'] += rows
+
+    # Report progress through a large phase, with an estimate of the time remaining.
+    def progress(self, done, total):
+        if self.current is None or self.verbosity < 1 or not sys.stderr.isatty():
+            return
+        now = time.time()
+        if now - self.lastprogress < Stats.PROGRESSINTERVAL and done < total:
+            return
+        self.lastprogress = now
+        self.progressshown = True
+        elapsed = now - self.current['Start']
+        message = '    ' + self.current['Phase'] + ': ' + str(done) + '/' + str(total)
+        if done > 0 and total > done:
+            message += ' ETA ' + str(int(elapsed * (total - done) / done)) + 's'
+        print('\r' + message.ljust(60), end='', file=sys.stderr)
+        sys.stderr.flush()
+
+    def summary(self):
+        self.end()
+        total = {
+                'Phase':       'total',
+                'Seconds':     time.time() - self.starttime,
+                'RowsRead':    sum(phase['RowsRead']    for phase in self.phases),
+                'RowsWritten': sum(phase['RowsWritten'] for phase in self.phases),
+                'Statements':  sum(phase['Statements']  for phase in self.phases),
+                'PeakMemory':  peakmemory()
+            }
+        for phase in self.phases:
+            phase['RowsPerSecond'] = (phase['RowsRead'] + phase['RowsWritten']) / phase['Seconds'] if phase['Seconds'] else None
+        return {'Name': self.name, 'Phases': self.phases, 'Total': total}
+
+    def report(self, file=sys.stderr):
+        summary = self.summary()
+        print('{:<24}{:>10}{:>12}{:>12}{:>12}{:>14}'.format('Phase', 'Seconds', 'Read', 'Written', 'Statements', 'Peak MB'), file=file)
+        for phase in summary['Phases'] + [summary['Total']]:
+            print('{:<24}{:>10.2f}{:>12}{:>12}{:>12}{:>14}'.format(
+                    phase['Phase'], phase['Seconds'], phase['RowsRead'], phase['RowsWritten'], phase['Statements'],
+                    '{:.1f}'.format(phase['PeakMemory'] / 1048576.0) if phase['PeakMemory'] is not None else '-'),
+                file=file)
+
+    def write(self, filename):
+        with open(filename, 'w') as statsfile:
+            json.dump(self.summary(), statsfile, indent=2)
+
+class SQLProfiler(object):
+    """Counts executions and cumulative time for each SQL statement template.
+
+    Templates executed more than threshold times within a single phase are flagged as
+    likely N+1 query patterns. A table ranked by cumulative time is printed at exit.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.templates = {}
+        self.currentphase = None
+        self.phasecounts  = {}
+
+    def attach(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('sqlprofilerstart', []).append(time.time())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.time() - conn.info['sqlprofilerstart'].pop()
+            template = re.sub(r'\s+', ' ', statement).strip()
+            stats = self.templates.get(template)
+            if stats is None:
+                stats = {'Count': 0, 'Seconds': 0.0, 'MaxPhaseCount': 0, 'FlaggedPhases': set()}
+                self.templates[template] = stats
+            stats['Count']   += 1
+            stats['Seconds'] += elapsed
+
+            phasecount = self.phasecounts.get(template, 0) + 1
+            self.phasecounts[template] = phasecount
+            stats['MaxPhaseCount'] = max(stats['MaxPhaseCount'], phasecount)
+            if phasecount > self.threshold:
+                stats['FlaggedPhases'].add(self.currentphase or 'main')
+
+    def phase(self, name):
+        self.currentphase = name
+        self.phasecounts  = {}
+
+    def report(self, file=sys.stderr, limit=40):
+        if len(self.templates) == 0:
+            return
+        ranked = sorted(self.templates.items(), key=lambda item: item[1]['Seconds'], reverse=True)
+        print('{:>8}{:>10}{:>10}{:>10}  {}'.format('Count', 'Seconds', 'Mean ms', 'Max/phase', 'Statement'), file=file)
+        for template, stats in ranked[:limit]:
+            print('{:>8}{:>10.3f}{:>10.3f}{:>10}{} {}'.format(
+                    stats['Count'], stats['Seconds'], 1000.0 * stats['Seconds'] / stats['Count'],
+                    stats['MaxPhaseCount'], '*' if stats['FlaggedPhases'] else ' ',
+                    template if len(template) <= 100 else template[:97] + '...'),
+                file=file)
+        flagged = [(template, stats) for template, stats in ranked if stats['FlaggedPhases']]
+        if flagged:
+            print('* Executed more than ' + str(self.threshold) + ' times in a single phase (possible N+1 queries):', file=file)
+            for template, stats in flagged:
+                print('    ' + ', '.join(sorted(stats['FlaggedPhases'])) + ': ' + (template if len(template) <= 100 else template[:97] + '...'), file=file)
+
+# SQL profiling is enabled by setting the environment variable NVIVOTOOLS_SQL_PROFILE to
+# the number of executions of one statement within a phase above which it is flagged.
+sqlprofiler = None
+if os.environ.get('NVIVOTOOLS_SQL_PROFILE'):
+    sqlprofiler = SQLProfiler(int(os.environ['NVIVOTOOLS_SQL_PROFILE']))
+    atexit.register(sqlprofiler.report)
+
+# Attach the SQL profiler to an engine if profiling is enabled.
+def profile(engine):
+    if sqlprofiler is not None:
+        sqlprofiler.attach(engine)
+    return engine
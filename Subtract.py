@@ -2,16 +2,14 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function
-from sqlalchemy import exc, TypeDecorator, CHAR, String, create_engine, MetaData, bindparam
+from sqlalchemy import exc, TypeDecorator, CHAR, String, create_engine, bindparam
 from sqlalchemy.engine import reflection
+from Schema import load_schema
 import warnings
 import sys
-import os
 import argparse
 import uuid
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
-
 try:
 
     parser = argparse.ArgumentParser(description='Subtract the contents of one database from another.')
@@ -39,17 +37,14 @@ try:
         ignorecols = []
 
     minuenddb = create_engine(args.minuend)
-    minuendmd = MetaData()
-    minuendmd.reflect(minuenddb)
+    minuendmd = load_schema(minuenddb)
 
     subtrahenddb = create_engine(args.subtrahend)
-    subtrahendmd = MetaData()
-    subtrahendmd.reflect(subtrahenddb)
+    subtrahendmd = load_schema(subtrahenddb)
 
     if args.difference != None:
         differencedb = create_engine(args.difference)
-        differencemd = MetaData()
-        differencemd.reflect(differencedb)
+        differencemd = load_schema(differencedb)
         differenceconn = differencedb.connect()
         differencetrans = differenceconn.begin()
         inspector = reflection.Inspector.from_engine(differencedb)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+import glob
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+scriptpath = os.path.dirname(os.path.realpath(__file__)) + os.path.sep
+
+# Conversion script and output extension for each input extension and target format
+CONVERSIONS = {
+    ('.nvpx', 'nvpn'): ('NormaliseNVPX.py', '.nvpn', ['--cmdline']),
+    ('.nvp',  'nvpn'): ('NormaliseNVP.py',  '.nvpn', []),
+    ('.nvpn', 'nvpx'): ('nvpn2nvpx.py',     '.nvpx', ['--cmdline', '--no-logfile']),
+    ('.nvpn', 'nvp'):  ('nvpn2nvp.py',      '.nvp',  ['--no-logfile']),
+}
+
+def batchConvert(arglist):
+    parser = argparse.ArgumentParser(description='Convert many NVivo or normalised NVivo files in parallel. '
+                                                 'Options for each conversion follow the input files after --, '
+                                                 'for example: batchConvert.py -j 4 *.nvpx -- --users overwrite')
+
+    parser.add_argument('-v', '--verbosity', type=int, default=1)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of conversions to run at once, default is the number of CPUs.')
+
+    parser.add_argument('--to', choices=["nvpx", "nvp"], default="nvpx",
+                        help='Format to convert normalised (.nvpn) files to.')
+    parser.add_argument('-o', '--outdir', type=str,
+                        help='Directory for output files, default is alongside each input file.')
+
+    parser.add_argument('infile', type=str, nargs='+',
+                        help="Input files or glob patterns")
+
+    # Everything after -- is passed on to each conversion, so that its options keep their values
+    if arglist is None:
+        arglist = sys.argv[1:]
+    if '--' in arglist:
+        convertargs = arglist[arglist.index('--')+1:]
+        arglist     = arglist[:arglist.index('--')]
+    else:
+        convertargs = []
+
+    args = parser.parse_args(arglist)
+
+    infiles = []
+    for pattern in args.infile:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print("WARNING: No files match " + pattern, file=sys.stderr)
+        infiles += matches
+
+    if args.outdir and not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    def convert(infile):
+        extension = os.path.splitext(infile)[1].lower()
+        conversion = CONVERSIONS.get((extension, 'nvpn' if extension != '.nvpn' else args.to))
+        if conversion is None:
+            return infile, None, 0, "Unrecognised file extension: " + extension
+
+        script, outextension, scriptargs = conversion
+        outfile = os.path.splitext(infile)[0] + outextension
+        if args.outdir:
+            outfile = os.path.join(args.outdir, os.path.basename(outfile))
+
+        # Each conversion runs in its own process, with its own database engine on its own port
+        cmd = [sys.executable, scriptpath + script, '--verbosity', str(args.verbosity)] + scriptargs + convertargs + [infile, outfile]
+        if args.verbosity > 1:
+            print("Running: ", cmd, file=sys.stderr)
+        starttime = time.time()
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, text=True)
+        return infile, p.returncode, time.time() - starttime, p.stdout
+
+    failures = 0
+    starttime = time.time()
+    with ThreadPoolExecutor(max(1, args.jobs)) as executor:
+        for future in as_completed([executor.submit(convert, infile) for infile in infiles]):
+            infile, returncode, seconds, output = future.result()
+            if returncode == 0:
+                print("OK      {:>8.1f}s  {}".format(seconds, infile))
+            else:
+                failures += 1
+                print("FAILED  {:>8.1f}s  {}".format(seconds, infile))
+                for line in output.strip().splitlines()[-10:]:
+                    print("        " + line)
+            sys.stdout.flush()
+
+    print(str(len(infiles) - failures) + " of " + str(len(infiles)) + " files converted in " + "{:.1f}".format(time.time() - starttime) + "s")
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(batchConvert(None))
@@ -25,10 +25,10 @@ from sqlalchemy import *
 import re
 from dateutil import parser as dateparser
 from datetime import date, time, datetime
-from distutils import util
+from DataTypes import strtobool
 import uuid
 
-def editNode(arglist=None):
+def editNode(arglist=None, norm=None):
     
     parser = ArgumentRecorder(description='Insert or update node in normalised file.')
 
@@ -63,7 +63,10 @@ def editNode(arglist=None):
 
     args = parser.parse_args(arglist)
 
-    if not args.no_logfile:
+    # A normalised file passed in is committed and closed by the caller, which keeps the log
+    ownnorm = norm is None
+
+    if ownnorm and not args.no_logfile:
         logFilename = args.outfile.rsplit('.',1)[0] + '.log'
         incomments = ArgumentHelper.read_comments(logFilename) or ArgumentHelper.separator()
         logfile = open(logFilename, 'w')
@@ -72,8 +75,9 @@ def editNode(arglist=None):
 
     try:
 
-        norm = NVivoNorm(args.outfile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(args.outfile)
+            norm.begin()
 
         datetimeNow = datetime.utcnow()
 
@@ -337,7 +341,7 @@ def editNode(arglist=None):
                 elif attributeType == 'time':
                     attributeValue = time.isoformat(dateparser.parse(attributeValue).time())
                 elif attributeType == 'boolean':
-                    attributeValue = str(bool(util.strtobool(attributeValue)))
+                    attributeValue = str(bool(strtobool(attributeValue)))
                 else:
                     raise RuntimeError("Unknown attribute type: " + attributeType)
 
@@ -390,14 +394,16 @@ def editNode(arglist=None):
         if nodeValuesToInsert:
             norm.con.execute(norm.NodeValue.insert(), nodeValuesToInsert)
 
-        norm.commit()
+        if ownnorm:
+            norm.commit()
 
     except:
         raise
         norm.rollback()
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     editNode(None)
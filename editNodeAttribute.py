@@ -16,105 +16,101 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
 import sys
 import argparse
+from NVivoNorm import NVivoNorm
 from sqlalchemy import *
-from sqlalchemy import exc
 import re
-from dateutil import parser as dateparser
 from datetime import date, time, datetime
-from distutils import util
 import uuid
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+def editNodeAttribute(arglist=None, norm=None):
 
+    parser = argparse.ArgumentParser(description='Insert or update node attribute in normalised file.')
 
-parser = argparse.ArgumentParser(description='Insert or update node attribute in normalised file.')
+    parser.add_argument('-v', '--verbosity',  type=int, default=1)
 
-parser.add_argument('-v', '--verbosity',  type=int, default=1)
+    parser.add_argument('-n', '--name',        type = str)
+    parser.add_argument('-d', '--description', type = str)
+    parser.add_argument('-t', '--type',        choices=["text", "integer", "decimal", "datetime", "date", "time", "boolean"])
+    parser.add_argument('-l', '--length',      type = int)
+    parser.add_argument('-u', '--user',        type = str,
+                        help = 'User name, default is project "modified by".')
 
-parser.add_argument('-n', '--name',        type = str)
-parser.add_argument('-d', '--description', type = str)
-parser.add_argument('-t', '--type',        choices=["text", "integer", "decimal", "datetime", "date", "time", "boolean"])
-parser.add_argument('-l', '--length',      type = int)
-parser.add_argument('-u', '--user',        type = str,
-                    help = 'User name, default is project "modified by".')
+    parser.add_argument('normFile', type=str)
 
-parser.add_argument('normFile', type=str)
+    args = parser.parse_args(arglist)
 
-args = parser.parse_args()
+    # A normalised file passed in is committed and closed by the caller
+    ownnorm = norm is None
 
-try:
-    normdb  = create_engine('sqlite:///' + args.normFile)
-    normmd  = MetaData(bind=normdb)
-    normcon = normdb.connect()
-    normtr  = normcon.begin()
+    try:
+        if ownnorm:
+            norm = NVivoNorm(args.normFile)
+            norm.begin()
 
-    normUser          = Table('User',          normmd, autoload=True)
-    normProject       = Table('Project',       normmd, autoload=True)
-    normNodeAttribute = Table('NodeAttribute', normmd, autoload=True)
-
-    if args.user is not None:
-        user = normcon.execute(select([
-                normUser.c.Id
-            ]).where(
-                normUser.c.Name == bindparam('Name')
-            ), {
-                'Name': args.user
-            }).first()
-        if user is not None:
-            userId = user['Id']
-        else:
-            userId = uuid.uuid4()
-            normocon.execute(normUser.insert(), {
-                    'Id':   userId,
+        if args.user is not None:
+            user = norm.con.execute(select([
+                    norm.User.c.Id
+                ]).where(
+                    norm.User.c.Name == bindparam('Name')
+                ), {
                     'Name': args.user
-                })
-    else:
-        project = normcon.execute(select([
-                normProject.c.ModifiedBy
-            ])).first()
-        userId = project['ModifiedBy']
-
-    att = normcon.execute(select([
-                normNodeAttribute.c.Id
-            ]).where(
-                normNodeAttribute.c.Name == bindparam('Name')
-            ), {
-                'Name': args.name
-            }).first()
-    Id = uuid.uuid4() if att is None else att['Id']
-
-    datetimeNow = datetime.utcnow()
-
-    catColumns = {
-            'Id':           Id,
-            '_Id':          Id,
-            'Name':         args.name,
-            'Description':  args.description,
-            'Type':         args.type.title(),
-            'Length':       args.length,
-            'CreatedBy':    userId,
-            'CreatedDate':  datetimeNow,
-            'ModifiedBy':   userId,
-            'ModifiedDate': datetimeNow
-        }
-    if att is None:    # New category
-        normcon.execute(normNodeAttribute.insert(), catColumns)
-    else:
-        normcon.execute(normNodeAttribute.update(
-                normNodeAttribute.c.Id == bindparam('_Id')),
-                catColumns)
-
-    normtr.commit()
-    normtr = None
-    normcon.close()
-    normdb.dispose()
-
-
-except:
-    raise
-    if not normtr is None:
-        normtr.rollback()
-    normdb.dispose()
+                }).first()
+            if user is not None:
+                userId = user['Id']
+            else:
+                userId = uuid.uuid4()
+                norm.con.execute(norm.User.insert(), {
+                        'Id':   userId,
+                        'Name': args.user
+                    })
+        else:
+            project = norm.con.execute(select([
+                    norm.Project.c.ModifiedBy
+                ])).first()
+            userId = project['ModifiedBy']
+
+        att = norm.con.execute(select([
+                    norm.NodeAttribute.c.Id
+                ]).where(
+                    norm.NodeAttribute.c.Name == bindparam('Name')
+                ), {
+                    'Name': args.name
+                }).first()
+        Id = uuid.uuid4() if att is None else att['Id']
+
+        datetimeNow = datetime.utcnow()
+
+        catColumns = {
+                'Id':           Id,
+                '_Id':          Id,
+                'Name':         args.name,
+                'Description':  args.description,
+                'Type':         args.type.title(),
+                'Length':       args.length,
+                'CreatedBy':    userId,
+                'CreatedDate':  datetimeNow,
+                'ModifiedBy':   userId,
+                'ModifiedDate': datetimeNow
+            }
+        if att is None:    # New category
+            norm.con.execute(norm.NodeAttribute.insert(), catColumns)
+        else:
+            norm.con.execute(norm.NodeAttribute.update(
+                    norm.NodeAttribute.c.Id == bindparam('_Id')),
+                    catColumns)
+
+        if ownnorm:
+            norm.commit()
+
+    except:
+        raise
+        norm.rollback()
+
+    finally:
+        if ownnorm and norm is not None:
+            norm.close()
+
+if __name__ == '__main__':
+    editNodeAttribute(None)
@@ -22,12 +22,10 @@ import sys
 from NVivoNorm import NVivoNorm
 from sqlalchemy import *
 import re
-from dateutil import parser as dateparser
 from datetime import date, time, datetime
-from distutils import util
 import uuid
 
-def editProject(arglist=None):
+def editProject(arglist=None, norm=None):
 
     parser = ArgumentRecorder(description='Insert or update project in normalised file.')
 
@@ -49,7 +47,11 @@ def editProject(arglist=None):
 
     args = parser.parse_args(arglist)
 
-    if not args.no_logfile:
+    # A normalised file opened by the caller is left to it to commit and close, and
+    # the caller keeps the logfile.
+    ownnorm = norm is None
+
+    if ownnorm and not args.no_logfile:
         logfilename = args.outfile.rsplit('.',1)[0] + '.log'
         incomments = ArgumentHelper.read_comments(logfilename) or ArgumentHelper.separator()
         logfile = open(logfilename, 'w')
@@ -58,8 +60,9 @@ def editProject(arglist=None):
 
     try:
 
-        norm = NVivoNorm(args.outfile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(args.outfile)
+            norm.begin()
 
         if args.user:
             userRecord = norm.con.execute(select([
@@ -107,14 +110,16 @@ def editProject(arglist=None):
         else:
             norm.con.execute(norm.Project.update(), projectColumns)
 
-        norm.commit()
+        if ownnorm:
+            norm.commit()
 
     except:
         raise
         norm.rollback()
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     editProject(None)
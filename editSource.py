@@ -26,21 +26,15 @@ from sqlalchemy import *
 import re
 from dateutil import parser as dateparser
 from datetime import date, time, datetime
-from distutils import util
 import uuid
 import chardet
 import codecs
-import subprocess
-import tempfile
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfpage import PDFPage
-from io import StringIO
+from Convert import pdftext, convert_document
+from Cache import get_cache
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
-def editSource(arglist=None):
+def editSource(arglist=None, norm=None):
 
     parser = ArgumentRecorder(description='Insert or update source in normalised file.')
 
@@ -84,6 +78,18 @@ def editSource(arglist=None):
     advancedGroup.add_argument('-v', '--verbosity', type=int, default=1, private=True)
     advancedGroup.add_argument('-l', '--limit',     type=int,
                                                     help='Limit number of lines from table file')
+    advancedGroup.add_argument('--cache-dir',       type=str, private=True,
+                                                    help='Directory in which to cache extracted text and converted documents.')
+    advancedGroup.add_argument('--cache-size',      type=int, default=1024, private=True,
+                                                    help='Maximum size of the cache in megabytes.')
+    advancedGroup.add_argument('--defer-indexes',   action='store_true', private=True,
+                                                    help='Create indexes on a new file after loading rather than before')
+    advancedGroup.add_argument('--blob-table',      action='store_true', private=True,
+                                                    help='Keep source objects of a new file in a separate table, storing identical ones once.')
+    advancedGroup.add_argument('--compress',        choices=["zlib", "zstd"], private=True,
+                                                    help='Store source objects and text of a new file compressed.')
+    advancedGroup.add_argument('--sqlite-profile',  choices=["default", "bulk"], default="bulk", private=True,
+                                                    help='SQLite settings for the normalised file; bulk favours loading speed over safety from crashes.')
     advancedGroup.add_argument('--logfile',         type=str, private=True,
                                                     help="Logfile, default is <outfile>.log")
     advancedGroup.add_argument('--no-logfile',      action='store_true',
@@ -94,7 +100,11 @@ def editSource(arglist=None):
     if args.textcol and args.filenamecol:
         raise RuntimeError("Only one of 'textcol' and 'filenamecol' may be specified")
 
-    if not args.no_logfile:
+    # A normalised file passed in is the caller's to commit and close, and it keeps the log
+    ownnorm  = norm is None
+    writelog = ownnorm and not args.no_logfile
+
+    if writelog:
         logfilename = args.outfile.rsplit('.',1)[0] + '.log'
         incomments = ArgumentHelper.read_comments(logfilename) or ArgumentHelper.separator()
         logfile = open(logfilename, 'w')
@@ -102,8 +112,9 @@ def editSource(arglist=None):
 
     try:
 
-        norm = NVivoNorm(args.outfile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(args.outfile, deferindexes=args.defer_indexes, sqliteprofile=args.sqlite_profile, blobtable=args.blob_table, compress=args.compress)
+            norm.begin()
 
         datetimeNow = datetime.utcnow()
 
@@ -174,7 +185,7 @@ def editSource(arglist=None):
                     tableFieldnames = next(csv.reader([line]))
                     break
 
-            if not args.no_logfile:
+            if writelog:
                 logfile.write(incomments)
 
             tableFieldnames = [fieldname if fieldname != args.namecol else 'Name' for fieldname in tableFieldnames]
@@ -360,11 +371,12 @@ def editSource(arglist=None):
 
                 sourceNodeId[colName] = nodeId
 
+        cache = get_cache(args.cache_dir, args.cache_size * 1048576)
+
         rowNum = 0
         sourcesToInsert      = []
         sourceValuesToInsert = []
         digits = len(str(len(sourceRows)))
-        unoconvcmd = None
         for sourceRow in sourceRows:
             rowNum += 1
 
@@ -426,7 +438,7 @@ def editSource(arglist=None):
                 elif attributeType == 'time':
                     attributeValue = time.isoformat(dateparser.parse(attributeValue).time())
                 elif attributeType == 'boolean':
-                    attributeValue = str(bool(util.strtobool(attributeValue)))
+                    attributeValue = str(bool(strtobool(attributeValue)))
                 else:
                     raise RuntimeError("Unknown attribute type: " + attributeType)
 
@@ -474,77 +486,16 @@ def editSource(arglist=None):
                     if ObjectFileExt in {'DOCX', 'DOC', 'ODT', 'TXT', 'RTF'}:
 
                         # Hack to remove hidden characters from RTF
+                        objectData = normSourceRow['Object']
                         if ObjectFileExt == 'RTF':
-                            rtfFile = open(ObjectPath, 'r')
-                            tempFilename = tempfile.mktemp() + '.rtf'
-                            tempFile = open(tempFilename, 'w')
-                            hiddenPattern = re.compile(r'{[^}].*\\v\\[^}]+}')
-                            for rtfLine in rtfFile.readlines():
-                                tempFile.write(hiddenPattern.sub('', rtfLine))
-
-                            tempFile.close()
-                            ObjectPath = tempFilename
-
-                        # Look for unoconvcmd just once
-                        if unoconvcmd is None:
-                            if args.verbosity > 1:
-                                print("Searching for unoconv executable.", file=sys.stderr)
-                            # Look first on path for OS installed version, otherwise use our copy
-                            for path in os.environ["PATH"].split(os.pathsep):
-                                unoconvpath = os.path.join(path, 'unoconv')
-                                if os.path.exists(unoconvpath):
-                                    if os.access(unoconvpath, os.X_OK) and '' in os.environ.get("PATHEXT", "").split(os.pathsep):
-                                        unoconvcmd = [unoconvpath]
-                                    else:
-                                        unoconvcmd = ['python', unoconvpath]
-                                    break
-                            if unoconvcmd is None:
-                                unoconvpath = os.path.join(NVivo.helperpath + 'unoconv')
-                                if os.path.exists(unoconvpath):
-                                    if os.access(unoconvpath, os.X_OK) and '' in os.environ.get("PATHEXT", "").split(os.pathsep):
-                                        unoconvcmd = [unoconvpath]
-                                    else:
-                                        unoconvcmd = ['python', unoconvpath]
-                            if unoconvcmd is None:
-                                raise RuntimeError("Can't find unoconv on path. Please refer to the NVivotools README file.")
-
-                        tmptextfilename = tempfile.mktemp() + '.txt'
-                        cmd = unoconvcmd + ['--format=text', '--output=' + tmptextfilename, ObjectPath]
-                        if args.verbosity > 1:
-                            print("Running: ", cmd)
-                        p = subprocess.run(cmd, stderr=subprocess.PIPE, text=True)
-                        err = p.stderr
-                        if err:
-                            print("Command: ", cmd)
-                            raise RuntimeError(err)
-
-                        normSourceRow['Content'] = codecs.open(tmptextfilename, 'r', 'utf-8-sig').read()
-                        os.remove(tmptextfilename)
+                            hiddenPattern = re.compile(br'{[^}].*\\v\\[^}]+}')
+                            objectData = b''.join(hiddenPattern.sub(b'', rtfLine) for rtfLine in objectData.splitlines(True))
 
-                        if ObjectFileExt == 'RTF':
-                            os.remove(ObjectPath)
+                        normSourceRow['Content'] = convert_document(objectData, ObjectFileExt, 'text', cache, args.verbosity).decode('utf-8-sig')
 
                     elif ObjectFileExt == 'PDF':
 
-                        rsrcmgr = PDFResourceManager()
-                        retstr = StringIO()
-                        laparams = LAParams()
-                        device = TextConverter(rsrcmgr, retstr, laparams=laparams)
-
-                        pdffileptr = open(ObjectPath, 'rb')
-                        interpreter = PDFPageInterpreter(rsrcmgr, device)
-                        pagenos = set()
-                        pdfpages = PDFPage.get_pages(pdffileptr, password='', check_extractable=True)
-                        pdfstr = ''
-                        for pdfpage in pdfpages:
-                            interpreter.process_page(pdfpage)
-                            pagestr = str(retstr.getvalue())
-                            pagestr = re.sub('(?<!\n)\n(?!\n)', ' ', pagestr).replace('\n\n', '\n').replace('\x00','')
-                            retstr.truncate(0)
-                            pdfstr += pagestr
-
-                        normSourceRow['Content'] = pdfstr
-                        pdffileptr.close()
+                        normSourceRow['Content'] = pdftext(normSourceRow['Object'], cache)['PlainText']
 
             else:
                 normSourceRow['ObjectType'] = u'TXT'
@@ -573,6 +524,10 @@ def editSource(arglist=None):
                                     'Source':       sourceId,
                                     'Node':         nodeId,
                                     'Fragment':     str(start) + u':' + str(end),
+                                    'StartX':       start,
+                                    'EndX':         end,
+                                    'StartY':       None,
+                                    'EndY':         None,
                                     'Memo':         None,
                                     'CreatedBy':    userId,
                                     'CreatedDate':  datetimeNow,
@@ -592,6 +547,7 @@ def editSource(arglist=None):
                 sourcesToInsert.append(normSourceRow)
                 sourceValuesToInsert += sourceValues
             else:
+                norm.storeblobs([normSourceRow])
                 norm.con.execute(norm.Source.update(
                         norm.Source.c.Id == bindparam('_Id')),
                         normSourceRow)
@@ -604,19 +560,22 @@ def editSource(arglist=None):
                 sourceValuesToInsert += sourceValues
 
         if sourcesToInsert:
+            norm.storeblobs(sourcesToInsert)
             norm.con.execute(norm.Source.insert(), sourcesToInsert)
         if sourceValuesToInsert:
             norm.con.execute(norm.SourceValue.insert(), sourceValuesToInsert)
 
-        norm.commit()
+        if ownnorm:
+            norm.commit()
 
     except:
         raise
         norm.rollback()
 
     finally:
-        del norm
-        if not args.no_logfile:
+        if ownnorm and norm is not None:
+            norm.close()
+        if writelog:
             logfile.close()
 
 
@@ -22,9 +22,7 @@ import argparse
 from NVivoNorm import NVivoNorm
 from sqlalchemy import *
 import re
-from dateutil import parser as dateparser
 from datetime import date, time, datetime
-from distutils import util
 import uuid
 
 def add_arguments(parser):
@@ -47,10 +45,10 @@ def add_arguments(parser):
     parser.set_defaults(hiddenargs=['hiddenargs', 'verbosity', 'no_comments'])
 
 
-def parse_arguments():
+def parse_arguments(arglist=None):
     parser = argparse.ArgumentParser()
     add_arguments(parser)
-    return vars(parser.parse_args())
+    return vars(parser.parse_args(arglist))
 
 def build_comments(kwargs):
     comments = ((' ' + kwargs['outfile'] + ' ') if kwargs['outfile'] else '').center(80, '#') + '\n'
@@ -76,10 +74,13 @@ def build_comments(kwargs):
 
 def editSourceCategory(outfile, name, description, user,
                      verbosity, no_comments,
-                     comments, **dummy):
+                     comments, norm=None, **dummy):
+
+    # A normalised file passed in is committed and closed by the caller, which keeps the log
+    ownnorm = norm is None
 
     try:
-        if not no_comments:
+        if ownnorm and not no_comments:
             logfilename = outfile.rsplit('.',1)[0] + '.log'
             if os.path.isfile(logfilename):
                 incomments = open(logfilename, 'r').read()
@@ -90,8 +91,9 @@ def editSourceCategory(outfile, name, description, user,
             logfile.write(incomments)
             logfile.close()
 
-        norm = NVivoNorm(outfile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(outfile)
+            norm.begin()
 
         if user is not None:
             userRecord = norm.con.execute(select([
@@ -161,19 +163,21 @@ def editSourceCategory(outfile, name, description, user,
             })
             norm.con.execute(norm.SourceCategory.insert(), attColumns)
 
-        norm.commit()
+        if ownnorm:
+            norm.commit()
 
     except:
         raise
         norm.rollback()
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
-def main():
-    kwargs = parse_arguments()
+def main(arglist=None, norm=None):
+    kwargs = parse_arguments(arglist)
     kwargs['comments'] = build_comments(kwargs)
-    kwargs['func'](**kwargs)
+    kwargs['func'](norm=norm, **kwargs)
 
 if __name__ == '__main__':
     main()
@@ -20,7 +20,7 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-from NVivoNorm import NVivoNorm
+from NVivoNorm import NVivoNorm, parse_fragment
 import csv
 from sqlalchemy import *
 from datetime import datetime
@@ -54,15 +54,17 @@ def add_arguments(parser):
     advancedgroup.add_argument('-v', '--verbosity', type=int, default=1)
     advancedgroup.add_argument('--no-comments',     action='store_true',
                                                     help='Do not produce a comments logfile')
+    advancedgroup.add_argument('--defer-indexes',   action='store_true',
+                                                    help='Create indexes on a new file after loading rather than before')
 
     parser.set_defaults(func=editTagging)
     parser.set_defaults(build_comments=build_comments)
-    parser.set_defaults(hiddenargs=['hiddenargs', 'verbosity', 'no_comments'])
+    parser.set_defaults(hiddenargs=['hiddenargs', 'verbosity', 'no_comments', 'defer_indexes'])
 
-def parse_arguments():
+def parse_arguments(arglist=None):
     parser = argparse.ArgumentParser()
     add_arguments(parser)
-    return vars(parser.parse_args())
+    return vars(parser.parse_args(arglist))
 
 def build_comments(kwargs):
     comments = ((' ' + kwargs['outfile'] + ' ') if kwargs['outfile'] else '').center(80, '#') + '\n'
@@ -89,12 +91,14 @@ def build_comments(kwargs):
 def editTagging(outfile, infile, user,
                 source, node, fragment, memo,
                 source_category, prelude, tagging,
-                verbosity, no_comments,
-                comments, **dummy):
+                verbosity, no_comments, defer_indexes,
+                comments, norm=None, **dummy):
+
+    # A normalised file passed in is committed and closed by the caller, which keeps the log
+    ownnorm = norm is None
 
     try:
 
-        norm = None
         if prelude:
             if verbosity >= 1:
                 print("Executing prelude code.", file=sys.stderr)
@@ -119,7 +123,7 @@ def evaltagging(sourceRow, csvRow):\n\
                     csvfieldnames = next(csv.reader([line]))
                     break
 
-        if not no_comments:
+        if ownnorm and not no_comments:
             logfilename = outfile.rsplit('.',1)[0] + '.log'
             if os.path.isfile(logfilename):
                 incomments = open(logfilename, 'r').read()
@@ -131,8 +135,9 @@ def evaltagging(sourceRow, csvRow):\n\
             logfile.write(incomments)
             logfile.close()
 
-        norm = NVivoNorm(outfile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(outfile, deferindexes=defer_indexes)
+            norm.begin()
 
         datetimeNow = datetime.utcnow()
 
@@ -182,6 +187,7 @@ def evaltagging(sourceRow, csvRow):\n\
 
         inrowcount = 0
         taggingRows = []
+        nodeIds = {}
         for csvRow in csvRows:
             csvRow = dict(csvRow)
             sourceSel = select([
@@ -229,20 +235,24 @@ def evaltagging(sourceRow, csvRow):\n\
 
                     if taggingItem.get('Node'):
                         for nodeItem in taggingItem['Node'].splitlines():
-                            nodeRec = norm.con.execute(select([
-                                        norm.Node.c.Id,
-                                    ]).where(
-                                        norm.Node.c.Name == bindparam('Node')
-                                    ), {
-                                        'Node': nodeItem
-                                    }).first()
-                            if nodeRec is None:
-                                raise RuntimeError("Node: " + nodeItem + " not found.")
+                            nodeId = nodeIds.get(nodeItem)
+                            if nodeId is None:
+                                nodeRec = norm.con.execute(select([
+                                            norm.Node.c.Id,
+                                        ]).where(
+                                            norm.Node.c.Name == bindparam('Node')
+                                        ), {
+                                            'Node': nodeItem
+                                        }).first()
+                                if nodeRec is None:
+                                    raise RuntimeError("Node: " + nodeItem + " not found.")
+                                nodeId = nodeRec['Id']
+                                nodeIds[nodeItem] = nodeId
 
                             taggingRows.append({
                                     'Id':           uuid.uuid4(),
                                     'Source':       sourceRow['Id'],
-                                    'Node':         nodeRec['Id'],
+                                    'Node':         nodeId,
                                     'Fragment':     taggingItem['Fragment'],
                                     'Memo':         taggingItem.get('Memo'),
                                     'CreatedBy':    userId,
@@ -250,6 +260,7 @@ def evaltagging(sourceRow, csvRow):\n\
                                     'ModifiedBy':   userId,
                                     'ModifiedDate': datetimeNow
                                 })
+                            taggingRows[-1].update(parse_fragment(taggingItem['Fragment']))
                     elif taggingItem.get('Memo'):
                         taggingRows.append({
                                 'Id':           uuid.uuid4(),
@@ -262,6 +273,7 @@ def evaltagging(sourceRow, csvRow):\n\
                                 'ModifiedBy':   userId,
                                 'ModifiedDate': datetimeNow
                             })
+                        taggingRows[-1].update(parse_fragment(taggingItem['Fragment']))
 
         if taggingRows:
             norm.con.execute(norm.Tagging.insert(), taggingRows)
@@ -269,19 +281,21 @@ def evaltagging(sourceRow, csvRow):\n\
         if verbosity >= 1:
             print("Inserted", len(taggingRows), "taggings.", file=sys.stderr)
 
-        norm.commit()
+        if ownnorm:
+            norm.commit()
 
     except:
         raise
         norm.rollback()
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
-def main():
-    kwargs = parse_arguments()
+def main(arglist=None, norm=None):
+    kwargs = parse_arguments(arglist)
     kwargs['comments'] = build_comments(kwargs)
-    kwargs['func'](**kwargs)
+    kwargs['func'](norm=norm, **kwargs)
 
 if __name__ == '__main__':
     main()
@@ -16,53 +16,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
-import sys
 import argparse
-from sqlalchemy import *
-from sqlalchemy import exc
-import re
-from datetime import datetime
+from NVivoNorm import NVivoNorm
 import uuid
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+def editUser(arglist=None, norm=None):
 
+    parser = argparse.ArgumentParser(description='Insert user into normalised file.')
 
-parser = argparse.ArgumentParser(description='Insert user into normalised file.')
+    parser.add_argument('-v', '--verbosity',  type=int, default=1)
 
-parser.add_argument('-v', '--verbosity',  type=int, default=1)
+    parser.add_argument('-n', '--name',       type = str)
 
-parser.add_argument('-n', '--name',       type = str)
+    parser.add_argument('normFile', type=str)
 
-parser.add_argument('normFile', type=str)
+    args = parser.parse_args(arglist)
 
-args = parser.parse_args()
+    # A normalised file passed in is committed and closed by the caller
+    ownnorm = norm is None
 
-try:
-    normdb  = create_engine('sqlite:///' + args.normFile)
-    normmd  = MetaData(bind=normdb)
-    normcon = normdb.connect()
-    normtr  = normcon.begin()
+    try:
+        if ownnorm:
+            norm = NVivoNorm(args.normFile)
+            norm.begin()
 
-    normUser            = Table('User', normmd, autoload=True)
+        Id = uuid.uuid4()
 
-    Id = uuid.uuid4()
+        userColumns = {
+                'Id':           Id,
+                'Name':         args.name,
+            }
+        norm.con.execute(norm.User.insert(), userColumns)
 
-    datetimeNow = datetime.utcnow()
+        if ownnorm:
+            norm.commit()
 
-    userColumns = {
-            'Id':           Id,
-            'Name':         args.name,
-        }
-    normcon.execute(normUser.insert(), userColumns)
+    except:
+        raise
+        norm.rollback()
 
-    normtr.commit()
-    normtr = None
-    normcon.close()
-    normdb.dispose()
+    finally:
+        if ownnorm and norm is not None:
+            norm.close()
 
-except:
-    raise
-    if not normtr is None:
-        normtr.rollback()
-    normdb.dispose()
+if __name__ == '__main__':
+    editUser(None)
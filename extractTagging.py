@@ -17,14 +17,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function
-import os
 import sys
 import argparse
 from sqlalchemy import *
 from sqlalchemy import exc
-import re
+from NVivoNorm import tagging_fragment, fragment_columns
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 
 parser = argparse.ArgumentParser(description='Extract tagging from normalised file.')
@@ -57,7 +56,7 @@ try:
             normNode.c.Name.label('NodeName'),
             normSource.c.Name.label('SourceName'),
             normSource.c.Content
-        ]).where(and_(
+        ] + fragment_columns(normTagging)).where(and_(
             normTagging.c.Node == normNode.c.Id,
             normSource.c.Id == normTagging.c.Source
         ))
@@ -78,11 +77,11 @@ try:
     for tagging in taggings:
         print("Node: " + tagging['NodeName'] + " Source: " + tagging['SourceName'] + "[" + tagging['Fragment'] + "]", file=sys.stderr)
 
-        matchfragment = re.match("([0-9]+):([0-9]+)(?:,([0-9]+)(?::([0-9]+))?)?", tagging['Fragment'])
-        if matchfragment is None:
+        fragment = tagging_fragment(tagging)
+        if fragment['StartX'] is None:
             print("WARNING: Unrecognised tagging fragment", file=sys.stderr)
         else:
-            print(tagging['Content'][int(matchfragment.group(1)):int(matchfragment.group(2))+1], file=sys.stderr)
+            print(tagging['Content'][fragment['StartX']:fragment['EndX']+1], file=sys.stderr)
 
         print("", file=sys.stderr)
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+from argrecord import ArgumentHelper, ArgumentRecorder
+import sys
+import argparse
+import importlib
+import shlex
+
+# Commands, each with the module and function that implement it and the option that
+# gives it the normalised file, or None if the file is its first positional argument.
+# Modules are only loaded once one of their commands is run.
+COMMANDS = {
+    'edit-project':          ('editProject',         'editProject',         '-o'),
+    'edit-user':             ('editUser',            'editUser',            None),
+    'edit-node-category':    ('editNodeCategory',    'main',                '-o'),
+    'edit-node-attribute':   ('editNodeAttribute',   'editNodeAttribute',   None),
+    'edit-node':             ('editNode',            'editNode',            '-o'),
+    'edit-source-category':  ('editSourceCategory',  'main',                '-o'),
+    'edit-source-attribute': ('editSourceAttribute', 'editSourceAttribute', None),
+    'edit-source':           ('editSource',          'editSource',          '-o'),
+    'edit-tagging':          ('editTagging',         'main',                '-o'),
+    'query-source':          ('querySource',         'main',                None),
+    'query-tagging':         ('queryTagging',        'queryTagging',        None),
+    'search-source':         ('searchSource',        'searchSource',        None)
+}
+
+# Run a command with its arguments. Given an open NVivoNorm, the command works on it
+# within its transaction, leaving the caller to commit it.
+def run_command(command, arglist, norm=None):
+    modulename, functionname, fileoption = COMMANDS[command]
+    function = getattr(importlib.import_module(modulename), functionname)
+    function(arglist, norm=norm)
+
+# Read a script of commands, returning the line number and arguments of each. Lines are
+# split as a shell would, a line ending in a backslash continues on the next, and
+# anything following a # is a comment.
+def read_script(scriptfile):
+    commands = []
+    line = ''
+    for lineno, scriptline in enumerate(scriptfile, 1):
+        if not line:
+            startlineno = lineno
+        line += scriptline.rstrip('\r\n')
+        if line.endswith('\\'):
+            line = line[:-1]
+            continue
+
+        arglist = shlex.split(line, comments=True)
+        line = ''
+        if not arglist:
+            continue
+        if arglist[0] not in COMMANDS:
+            raise RuntimeError("Line " + str(startlineno) + ": unknown command " + arglist[0])
+        commands.append((startlineno, arglist))
+
+    if line:
+        raise RuntimeError("Line " + str(startlineno) + ": command continues past end of script")
+
+    return commands
+
+def runScript(arglist=None):
+
+    parser = ArgumentRecorder(prog='nvivotools run-script',
+                              description='Run a script of commands against a normalised file in one process and one transaction, so that either all of them or none take effect.')
+
+    generalgroup = parser.add_argument_group('General')
+    generalgroup.add_argument(      'file',      type=str, output=True,
+                                                 help='Normalised NVivo (.nvpn) file')
+    generalgroup.add_argument(      'script',    type=str, input=True,
+                                                 help="File of commands, one per line, or '-' for standard input. Each is written as on the command line, without the normalised file.")
+
+    advancedgroup = parser.add_argument_group('Advanced')
+    advancedgroup.add_argument('-v', '--verbosity', type=int, default=1, private=True)
+    advancedgroup.add_argument('--sqlite-profile',  choices=["default", "bulk"], default="default", private=True,
+                                                    help='SQLite settings for the normalised file; bulk favours speed over safety from crashes.')
+    advancedgroup.add_argument('--logfile',         type=str, private=True,
+                                                    help="Logfile, default is <file>.log")
+    advancedgroup.add_argument('--no-logfile',      action='store_true',
+                                                    help='Do not output a logfile')
+
+    args = parser.parse_args(arglist)
+
+    # Read the whole script first, so that a mistake in it is found before anything runs
+    if args.script == '-':
+        commands = read_script(sys.stdin)
+    else:
+        with open(args.script, 'r') as scriptfile:
+            commands = read_script(scriptfile)
+
+    if not args.no_logfile:
+        logfilename = args.logfile or args.file.rsplit('.',1)[0] + '.log'
+        incomments = ArgumentHelper.read_comments(logfilename) or ArgumentHelper.separator()
+        logfile = open(logfilename, 'w')
+        parser.write_comments(args, logfile, incomments=incomments)
+        logfile.close()
+
+    from NVivoNorm import NVivoNorm
+
+    norm = NVivoNorm(args.file, sqliteprofile=args.sqlite_profile)
+    try:
+        norm.begin()
+
+        for lineno, commandargs in commands:
+            command = commandargs[0]
+            fileoption = COMMANDS[command][2]
+            if args.verbosity > 1:
+                print("Line " + str(lineno) + ": " + command, file=sys.stderr)
+
+            try:
+                run_command(command, ([fileoption] if fileoption else []) + [args.file] + commandargs[1:], norm)
+            except:
+                print("Line " + str(lineno) + ": " + command + " failed, no changes made", file=sys.stderr)
+                raise
+
+        norm.commit()
+        if args.verbosity > 0:
+            print("Ran " + str(len(commands)) + " command(s)", file=sys.stderr)
+
+    except:
+        norm.rollback()
+        raise
+
+    finally:
+        norm.close()
+
+def nvivotools(arglist=None):
+
+    parser = argparse.ArgumentParser(prog='nvivotools',
+                                     description='Run an NVivotools command. Use "nvivotools <command> --help" for the arguments of each command, and run-script to run a file of commands in one transaction.')
+
+    parser.add_argument('command', choices=sorted(COMMANDS) + ['run-script'], metavar='command',
+                                   help='One of ' + ', '.join(sorted(COMMANDS) + ['run-script']))
+    parser.add_argument('args',    nargs=argparse.REMAINDER,
+                                   help='Arguments to the command')
+
+    args = parser.parse_args(arglist)
+
+    if args.command == 'run-script':
+        runScript(args.args)
+    else:
+        run_command(args.command, args.args)
+
+if __name__ == '__main__':
+    nvivotools(None)
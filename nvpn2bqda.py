@@ -19,12 +19,10 @@
 import os
 import sys
 from argrecord import ArgumentHelper, ArgumentRecorder
-from NVivoNorm import NVivoNorm
+from NVivoNorm import NVivoNorm, tagging_fragment, fragment_columns
 from sqlalchemy import *
-import re
 import csv
 import shutil
-import re
 
 def nvpn2bqda(arglist=None):
     parser = ArgumentRecorder(description='Export NVPN to BarraQDA project.',
@@ -39,6 +37,8 @@ def nvpn2bqda(arglist=None):
     advancedgroup = parser.add_argument_group('Advanced')
     advancedgroup.add_argument('-v', '--verbosity',  type=int, default=1, private=True)
     advancedgroup.add_argument('--logfile',          type=str, help="Logfile")
+    advancedgroup.add_argument('--sqlite-profile',   choices=["default", "read"], default="read", private=True,
+                                                     help='SQLite settings for the normalised file; read is faster but the file cannot be changed.')
 
     args = parser.parse_args(arglist)
 
@@ -47,8 +47,9 @@ def nvpn2bqda(arglist=None):
         parser.write_comments(args, logfile, incomments=ArgumentHelper.separator())
         logfile.close()
 
+    norm = None
     try:
-        norm = NVivoNorm(args.infile)
+        norm = NVivoNorm(args.infile, sqliteprofile=args.sqlite_profile)
         norm.begin()
         
         docdata = os.path.join(args.outbase, 'docdata')
@@ -59,7 +60,7 @@ def nvpn2bqda(arglist=None):
                 norm.Source.c.Id,
                 norm.Source.c.Name,
                 norm.Source.c.ObjectType,
-                norm.Source.c.Object
+                norm.blobcolumn('Object')
             ])
         nodesel = select([
                 norm.Node.c.Id,
@@ -80,15 +81,28 @@ def nvpn2bqda(arglist=None):
                 norm.Tagging.c.ModifiedDate,
                 norm.Tagging.c.CreatedDate,
                 norm.User.c.Name.label('User')
-            ]).select_from(
+            ] + fragment_columns(norm.Tagging)).select_from(
                 norm.Tagging.join(
                 norm.User,
                 norm.User.c.Id == norm.Tagging.c.ModifiedBy
             )).where(
                 norm.Tagging.c.Source == bindparam('Source'),
             )                  
-        fragmentregex = re.compile(r'(?P<start>[0-9]+):(?P<end>[0-9]+)')
-                               
+        # The node list is the same for every source so only build it once
+        nodexml = ''
+        for node in norm.con.execute(nodesel):
+            nodexml += "  <node name=\"" + node['Name'] + "\" uniqueName=\"okular-{" + str(node['Id']) + "}\""
+            anyattr = False
+            for nodeattr in norm.con.execute(nodeattrsel, { 'Node': node['Id'] }):
+                if not anyattr:
+                    anyattr = True
+                    nodexml += ">\n"
+                    nodexml += "   <attribute name=\"" + nodeattr['Attribute'] + "\" value=\"" + nodeattr['Value'] + "\"/>\n"
+            if anyattr:
+                nodexml += "  </node>\n"
+            else:
+                nodexml += "/>\n"
+
         for source in norm.con.execute(sourcesel):
             sourcefilename = os.path.join(args.outbase, source['Name'] + '.' + source['ObjectType'].lower())
             sourcefile = open(sourcefilename, 'wb')
@@ -101,25 +115,14 @@ def nvpn2bqda(arglist=None):
 <documentInfo url=\"""" + os.path.realpath(sourcefilename) + """\">
  <QDA>
 """)
-            for node in norm.con.execute(nodesel):
-                docfile.write("  <node name=\"" + node['Name'] + "\" uniqueName=\"okular-{" + str(node['Id']) + "}\"")
-                anyattr = False
-                for nodeattr in norm.con.execute(nodeattrsel, { 'Node': node['Id'] }):
-                    if not anyattr:
-                        anyattr = True
-                        docfile.write(">\n")
-                        docfile.write("   <attribute name=\"" + nodeattr['Attribute'] + "\" value=\"" + nodeattr['Value'] + "\"/>\n")
-                if anyattr:
-                    docfile.write("  </node>\n")
-                else:
-                    docfile.write("/>\n")
+            docfile.write(nodexml)
             docfile.write(" </QDA>\n")
 
             anytagging = False
             for tagging in norm.con.execute(taggingsel, { 'Source': source['Id'] }):
-                matchfragment = fragmentregex.match(tagging['Fragment'])
-                start = int(matchfragment.group('start')) - 1
-                end   = int(matchfragment.group('end'))
+                fragment = tagging_fragment(tagging)
+                start = fragment['StartX'] - 1
+                end   = fragment['EndX']
                 if not anytagging:
                     anytagging = True
                     docfile.write("""
@@ -144,7 +147,8 @@ def nvpn2bqda(arglist=None):
         raise
 
     finally:
-        del norm
+        if norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     nvpn2bqda(None)
@@ -66,6 +66,16 @@ def DenormaliseNVP(arglist):
                         help="Base NVP file to insert into")
 
     parser.add_argument('-v', '--verbosity', type=int, default=1, private=True)
+    parser.add_argument('--batch-size',      type=int, default=1000, private=True,
+                                             help='Number of rows per bulk database statement.')
+    parser.add_argument('--stats-file',      type=str, private=True,
+                                             help='Write per-phase timing, row count and memory statistics to this JSON file.')
+    parser.add_argument('-j', '--jobs',      type=int, default=1, private=True,
+                                             help='Number of worker processes used to convert sources.')
+    parser.add_argument('--cache-dir',       type=str, private=True,
+                                             help='Directory in which to cache extracted text and converted documents.')
+    parser.add_argument('--cache-size',      type=int, default=1024, private=True,
+                                             help='Maximum size of the cache in megabytes.')
     parser.add_argument('--logfile',         type=str, help="Logfile, default is <outfile>.log",
                                              private=True)
     parser.add_argument('--no-logfile',      action='store_true', help='Do not output a logfile')
@@ -39,15 +39,17 @@ def add_arguments(parser):
     advancedgroup = parser.add_argument_group('Advanced')
     advancedgroup.add_argument('-v', '--verbosity',  type=int, default=1)
     advancedgroup.add_argument('--no-comments', action='store_true', help='Do not produce a comments logfile')
+    advancedgroup.add_argument('--sqlite-profile', choices=["default", "read"], default="read",
+                               help='SQLite settings for the normalised file; read is faster but the file cannot be changed.')
 
     parser.set_defaults(func=querySource)
     parser.set_defaults(build_comments=build_comments)
-    parser.set_defaults(hiddenargs=['hiddenargs', 'verbosity', 'no_comments'])
+    parser.set_defaults(hiddenargs=['hiddenargs', 'verbosity', 'no_comments', 'sqlite_profile'])
 
-def parse_arguments():
+def parse_arguments(arglist=None):
     parser = argparse.ArgumentParser()
     add_arguments(parser)
-    return vars(parser.parse_args())
+    return vars(parser.parse_args(arglist))
 
 def build_comments(kwargs):
     comments = ((' ' + kwargs['outfile'] + ' ') if kwargs['outfile'] else '').center(80, '#') + '\n'
@@ -73,12 +75,16 @@ def build_comments(kwargs):
 
 def querySource(infile, outfile,
                  source, category,
-                 verbosity, no_comments,
-                 comments, **dummy):
+                 verbosity, no_comments, sqlite_profile,
+                 comments, norm=None, **dummy):
+
+    # A normalised file passed in is left open for the caller
+    ownnorm = norm is None
 
     try:
-        norm = NVivoNorm(infile)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(infile, sqliteprofile=sqlite_profile)
+            norm.begin()
 
         sourcesel = select([
                 norm.Source.c.Name,
@@ -128,18 +134,20 @@ def querySource(infile, outfile,
         for source in norm.con.execute(sourcesel, params):
             csvwriter.writerow(dict(source))
 
-        csvfile.close()
+        if outfile:
+            csvfile.close()
 
     except:
         raise
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
-def main():
-    kwargs = parse_arguments()
+def main(arglist=None, norm=None):
+    kwargs = parse_arguments(arglist)
     kwargs['comments'] = build_comments(kwargs)
-    kwargs['func'](**kwargs)
+    kwargs['func'](norm=norm, **kwargs)
 
 if __name__ == '__main__':
     main()
@@ -20,13 +20,13 @@ from argrecord import ArgumentHelper, ArgumentRecorder
 import os
 import sys
 import argparse
-from NVivoNorm import NVivoNorm
+from NVivoNorm import NVivoNorm, tagging_fragment, fragment_columns
 from sqlalchemy import *
 import re
 import csv
 import shutil
 
-def queryTagging(arglist=None):
+def queryTagging(arglist=None, norm=None):
 
     parser = ArgumentRecorder(description="Query taggings in a normalised file.")
 
@@ -39,6 +39,8 @@ def queryTagging(arglist=None):
     generalgroup.add_argument('-sc', '--source-category', type=str)
     generalgroup.add_argument('-n',  '--node', nargs='*', type=str)
     generalgroup.add_argument('-nc', '--node-category',   type=str)
+    generalgroup.add_argument('-r',  '--range',           type=str,
+                                                          help="Only taggings that overlap a range of characters, given as 'start:end'")
 
     advancedgroup = parser.add_argument_group('Advanced')
     advancedgroup.add_argument('-v', '--verbosity', type=int, default=1, private=True)
@@ -46,12 +48,18 @@ def queryTagging(arglist=None):
                                                     help="Limit number of sources to process")
     advancedgroup.add_argument('--no-comments',     action='store_true', 
                                                     help='Do not output comments in header of output file')
+    advancedgroup.add_argument('--sqlite-profile',  choices=["default", "read"], default="read", private=True,
+                                                    help='SQLite settings for the normalised file; read is faster but the file cannot be changed.')
 
     args = parser.parse_args(arglist)
-    
+
+    # A normalised file passed in is left open for the caller
+    ownnorm = norm is None
+
     try:
-        norm = NVivoNorm(args.file)
-        norm.begin()
+        if ownnorm:
+            norm = NVivoNorm(args.file, sqliteprofile=args.sqlite_profile)
+            norm.begin()
 
         sourcesel = select([
                 norm.Source.c.Name.label('Source'),
@@ -59,7 +67,7 @@ def queryTagging(arglist=None):
                 norm.Source.c.Content,
                 norm.Tagging.c.Fragment,
                 norm.Tagging.c.Memo
-            ]).where(
+            ] + fragment_columns(norm.Tagging)).where(
                 norm.Source.c.Id == norm.Tagging.c.Source,
             ).select_from(
                 norm.Tagging.outerjoin(
@@ -81,6 +89,21 @@ def queryTagging(arglist=None):
             ))
             params.update({'SourceCategory': args.source_category})
 
+        if args.range:
+            rangematch = re.match(r'([0-9]+):([0-9]+)$', args.range)
+            if rangematch is None:
+                raise RuntimeError("Illegal range specification: " + args.range)
+            rangestart = int(rangematch.group(1))
+            rangeend   = int(rangematch.group(2))
+            # Files made by older versions have no fragment columns; their taggings
+            # are filtered below instead.
+            if 'StartX' in norm.Tagging.c:
+                sourcesel = sourcesel.where(and_(
+                    norm.Tagging.c.StartX <= bindparam('RangeEnd'),
+                    norm.Tagging.c.EndX   >= bindparam('RangeStart')
+                ))
+                params.update({'RangeStart': rangestart, 'RangeEnd': rangeend})
+
         tagginglist = []
         if args.node_category:
             sourceselnodecat = sourcesel.where(and_(
@@ -102,12 +125,13 @@ def queryTagging(arglist=None):
         elif not args.node_category:
             tagginglist = [[dict(row) for row in norm.con.execute(sourcesel, params)]]
 
-        fragmentregex = re.compile(r'(?P<start>[0-9]+):(?P<end>[0-9]+)')
         for taggings in tagginglist:
-            for tagging in taggings:
-                matchfragment = fragmentregex.match(tagging['Fragment'])
-                tagging['Start'] = int(matchfragment.group('start'))
-                tagging['End']   = int(matchfragment.group('end'))
+            for tagging in taggings[:]:
+                fragment = tagging_fragment(tagging)
+                tagging['Start'] = fragment['StartX']
+                tagging['End']   = fragment['EndX']
+                if args.range and (tagging['Start'] > rangeend or tagging['End'] < rangestart):
+                    taggings.remove(tagging)
 
         def sortandmergetagginglist(tagginglist):
             tagginglist.sort(key = lambda tagging: (tagging['Source'], tagging['NodeTuple'], tagging['Start'], tagging['End']))
@@ -130,19 +154,22 @@ def queryTagging(arglist=None):
 
         sortandmergetagginglist(intersection)
         for taggings in tagginglist[1:]:
-            idx = 0
+            # Only taggings of the same source can intersect
+            taggingsbysource = {}
+            for tagging in taggings:
+                taggingsbysource.setdefault(tagging['Source'], []).append(tagging)
+
             newintersection = []
             for intagging in intersection:
-                for tagging in taggings:
-                    if tagging['Source'] == intagging['Source']:
-                        newstart = max(tagging['Start'], intagging['Start'])
-                        newend   = min(tagging['End'],   intagging['End'])
-                        if newend >= newstart:
-                            newintersection.append({'Source': tagging['Source'],
-                                                    'NodeTuple': (tagging['Node'],) +  intagging['NodeTuple'],
-                                                    'Content': tagging['Content'],
-                                                    'Start': newstart,
-                                                    'End':   newend})
+                for tagging in taggingsbysource.get(intagging['Source'], []):
+                    newstart = max(tagging['Start'], intagging['Start'])
+                    newend   = min(tagging['End'],   intagging['End'])
+                    if newend >= newstart:
+                        newintersection.append({'Source': tagging['Source'],
+                                                'NodeTuple': (tagging['Node'],) +  intagging['NodeTuple'],
+                                                'Content': tagging['Content'],
+                                                'Start': newstart,
+                                                'End':   newend})
 
             intersection = newintersection
             sortandmergetagginglist(intersection)
@@ -172,13 +199,15 @@ def queryTagging(arglist=None):
             tagging['Node'] = os.linesep.join(nodeiter for nodeiter in tagging['NodeTuple'])
 
         csvwriter.writerows(intersection)
-        csvfile.close()
+        if args.outfile:
+            csvfile.close()
 
     except:
         raise
 
     finally:
-        del norm
+        if ownnorm and norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     queryTagging(None)
@@ -24,7 +24,7 @@ import fnmatch
 from NVivoNorm import NVivoNorm
 from sqlalchemy import *
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 def saveSources(arglist):
 
@@ -33,6 +33,8 @@ def saveSources(arglist):
 
     parser.add_argument('-v', '--verbosity',  type=int, default=1)
     parser.add_argument('--no-comments', action='store_true', help='Do not produce a comments logfile')
+    parser.add_argument('--sqlite-profile', choices=["default", "read"], default="read",
+                        help='SQLite settings for the normalised file; read is faster but the file cannot be changed.')
 
     parser.add_argument('-s', '--source',  type=str, default = '%',
                                            help='Source or name or pattern')
@@ -44,8 +46,9 @@ def saveSources(arglist):
 
 
     args = parser.parse_args()
-    hiddenargs = ['verbosity']
+    hiddenargs = ['verbosity', 'sqlite_profile']
 
+    norm = None
     try:
         if not args.no_comments:
             logfilename = os.path.join(args.path, 'saveSources.log')
@@ -73,10 +76,10 @@ def saveSources(arglist):
             with open(logfilename, 'w') as logfile:
                 logfile.write(comments)
 
-        norm = NVivoNorm(args.infile)
+        norm = NVivoNorm(args.infile, sqliteprofile=args.sqlite_profile)
         norm.begin()
 
-        query = select([norm.Source.c.Name, norm.Source.c.Object, norm.Source.c.ObjectType]).where(
+        query = select([norm.Source.c.Name, norm.blobcolumn('Object'), norm.Source.c.ObjectType]).where(
                         norm.Source.c.Name.like(literal(args.source)))
         for row in norm.con.execute(query):
             outfile = open(os.path.join(args.path, row.Name + '.' + row.ObjectType.lower()), 'wb')
@@ -85,8 +88,10 @@ def saveSources(arglist):
 
     except:
         raise
-        norm.rollback()
-        del norm
+
+    finally:
+        if norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     saveSources(None)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from argrecord import ArgumentHelper, ArgumentRecorder
+import os
+import sys
+from NVivoNorm import NVivoNorm, SOURCETEXT, has_source_text_index, tagging_fragment, fragment_columns
+from sqlalchemy import *
+import csv
+import shutil
+
+# Characters that mark the matched terms in text returned by the index, from which
+# their offsets are found
+MATCHSTART = u'\x02'
+MATCHEND   = u'\x03'
+
+# Return the (start, end) offsets, counted from 0 and exclusive of end, of the terms
+# marked in highlighted text.
+def match_offsets(highlight):
+    offsets = []
+    offset = 0
+    for ch in highlight:
+        if ch == MATCHSTART:
+            start = offset
+        elif ch == MATCHEND:
+            offsets.append((start, offset))
+        else:
+            offset += 1
+
+    return offsets
+
+def searchSource(arglist=None, norm=None):
+
+    parser = ArgumentRecorder(description="Search the text of sources in a normalised file with its full text index.")
+
+    generalgroup = parser.add_argument_group('General')
+    generalgroup.add_argument(      'file',      type=str,
+                                                 help='Normalised NVivo (.nvpn) file')
+    generalgroup.add_argument(      'query',     type=str,
+                                                 help='Search terms, in SQLite FTS5 query syntax')
+    generalgroup.add_argument('-o', '--outfile', type=str,
+                                                 help='Output CSV file')
+    generalgroup.add_argument('-s',  '--source',          type=str)
+    generalgroup.add_argument('-sc', '--source-category', type=str)
+    generalgroup.add_argument('-n',  '--node',            type=str,
+                                                          help='Only matches within text tagged by this node')
+
+    advancedgroup = parser.add_argument_group('Advanced')
+    advancedgroup.add_argument('-v', '--verbosity', type=int, default=1, private=True)
+    advancedgroup.add_argument('-l', '--limit',     type=int, default=0,
+                                                    help="Limit number of sources to return, best matches first")
+    advancedgroup.add_argument('-c', '--context',   type=int, default=40,
+                                                    help="Number of characters of context either side of each match")
+    advancedgroup.add_argument('--no-comments',     action='store_true',
+                                                    help='Do not output comments in header of output file')
+    advancedgroup.add_argument('--sqlite-profile',  choices=["default", "read"], default="read", private=True,
+                                                    help='SQLite settings for the normalised file; read is faster but the file cannot be changed.')
+
+    args = parser.parse_args(arglist)
+
+    # A normalised file passed in is left open for the caller
+    ownnorm = norm is None
+
+    try:
+        if ownnorm:
+            norm = NVivoNorm(args.file, sqliteprofile=args.sqlite_profile)
+            norm.begin()
+
+        if not has_source_text_index(norm.con):
+            raise RuntimeError("File has no text index, add one with: upgradeNorm.py --text-index add " + args.file)
+
+        # The index finds and ranks matching sources, and marks the matched terms in
+        # their text, without the text of other sources being read.
+        sourcetext = table(SOURCETEXT, column('rowid'))
+        searchsel = select([
+                norm.Source.c.Id,
+                norm.Source.c.Name.label('Source'),
+                func.highlight(literal_column(SOURCETEXT), 0, MATCHSTART, MATCHEND).label('Highlight')
+            ]).select_from(
+                norm.Source.join(sourcetext, sourcetext.c.rowid == literal_column('Source.rowid'))
+            ).where(
+                literal_column(SOURCETEXT).op('MATCH')(bindparam('Query'))
+            ).order_by(
+                literal_column('rank')
+            )
+        params = {'Query': args.query}
+
+        if args.source:
+            searchsel = searchsel.where(
+                norm.Source.c.Name == bindparam('Source')
+            )
+            params.update({'Source': args.source})
+
+        if args.source_category:
+            searchsel = searchsel.where(and_(
+                norm.Source.c.Category == norm.SourceCategory.c.Id,
+                norm.SourceCategory.c.Name == bindparam('SourceCategory')
+            ))
+            params.update({'SourceCategory': args.source_category})
+
+        if args.limit:
+            searchsel = searchsel.limit(args.limit)
+
+        if args.node:
+            taggingsel = select([
+                    norm.Tagging.c.Fragment
+                ] + fragment_columns(norm.Tagging)).where(and_(
+                    norm.Tagging.c.Source == bindparam('Source'),
+                    norm.Tagging.c.Node == norm.Node.c.Id,
+                    norm.Node.c.Name == bindparam('Node')
+                ))
+
+        if args.outfile:
+            if os.path.exists(args.outfile):
+                shutil.move(args.outfile, args.outfile + '.bak')
+
+            csvfile = open(args.outfile, 'w')
+        else:
+            csvfile = sys.stdout
+
+        if not args.no_comments:
+            parser.write_comments(args, csvfile, incomments=ArgumentHelper.separator())
+
+        csvwriter = csv.DictWriter(csvfile,
+                                   fieldnames=['Source', 'Fragment', 'Text', 'Context'],
+                                   extrasaction='ignore',
+                                   lineterminator=os.linesep,
+                                   quoting=csv.QUOTE_NONNUMERIC)
+
+        csvwriter.writeheader()
+
+        for source in norm.con.execute(searchsel, params).fetchall():
+            content = source['Highlight'].replace(MATCHSTART, u'').replace(MATCHEND, u'')
+            offsets = match_offsets(source['Highlight'])
+
+            if args.node:
+                taggings = [tagging_fragment(tagging) for tagging in norm.con.execute(taggingsel, {'Source': source['Id'], 'Node': args.node})]
+                offsets = [(start, end) for start, end in offsets
+                           if any(tagging['StartX'] is not None and tagging['StartX'] <= end and tagging['EndX'] > start for tagging in taggings)]
+
+            for start, end in offsets:
+                csvwriter.writerow({
+                        'Source':   source['Source'],
+                        'Fragment': str(start + 1) + ':' + str(end),
+                        'Text':     content[start:end],
+                        'Context':  content[max(0, start - args.context):end + args.context]
+                    })
+
+        if args.outfile:
+            csvfile.close()
+
+    except:
+        raise
+
+    finally:
+        if ownnorm and norm is not None:
+            norm.close()
+
+if __name__ == '__main__':
+    searchSource(None)
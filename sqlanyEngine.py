@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import argparse
+from sqlanyTools import sqlanyAPI
+
+def sqlanyEngine(arglist):
+    parser = argparse.ArgumentParser(description='Start, stop or list the databases of a persistent SQL Anywhere engine shared by NVivotools invocations.')
+
+    parser.add_argument('-v', '--verbosity', type=int, default=1)
+
+    parser.add_argument('action', choices=["start", "stop", "status"],
+                        help="Action to perform")
+
+    args = parser.parse_args(arglist)
+
+    api = sqlanyAPI(persistent=(args.action == 'start'), verbosity=args.verbosity)
+
+    if args.action == 'stop':
+        api.stop()
+    elif args.action == 'status':
+        if api.engine is None:
+            print("No persistent database server is running")
+        else:
+            print("Database server " + api.engine['ServerName'] + " on port " + api.engine['Port'])
+            for dbname in api.list():
+                print("    " + dbname)
+
+if __name__ == '__main__':
+    sqlanyEngine(None)
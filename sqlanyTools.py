@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import os
+import re
+import sys
+import glob
+import json
+import time
+import ctypes
+import random
+import secrets
+import socket
+import subprocess
+
+helperpath = os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'helpers' + os.path.sep
+
+ENVCACHEFILE = os.path.join(os.path.expanduser('~'), '.nvivotools', 'sqlanyenv.json')
+
+# Modification time of a file, or None if it does not exist
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+# Run helpers/sqlanyenv.sh to find a SQL Anywhere installation and return the environment
+# variables it sets, caching the result by installation path. The cached environment is
+# used for as long as neither the installation directory nor the engine it found change.
+def sqlanyenvironment(sqlanywhere=None, verbosity=1):
+    if sqlanywhere is None:
+        sqlanywhere = os.environ.get('sqlanywhere') or ('/Applications' if sys.platform == 'darwin' else '/opt')
+
+    try:
+        with open(ENVCACHEFILE, 'r') as cachefile:
+            cache = json.load(cachefile)
+    except (IOError, OSError, ValueError):
+        cache = {}
+
+    cached = cache.get(sqlanywhere)
+    if cached is not None and cached['Mtime'] == mtime(sqlanywhere) \
+                          and cached['EngineMtime'] == mtime(cached['Environment'].get('dbeng', '')):
+        if verbosity > 1:
+            print("Using cached SQL Anywhere environment for " + sqlanywhere, file=sys.stderr)
+        return cached['Environment']
+
+    environment = dict(os.environ)
+    environment['sqlanywhere'] = sqlanywhere
+    envlines = subprocess.check_output(helperpath + 'sqlanyenv.sh', text=True, env=environment).splitlines()
+    environment = {}
+    for envline in envlines:
+        env = re.match(r"(?P<name>\w+)=(?P<quote>['\"]?)(?P<value>.*)(?P=quote)", envline, re.MULTILINE | re.DOTALL)
+        if env is not None:
+            environment[env.group('name')] = env.group('value')
+
+    cache[sqlanywhere] = {
+            'Mtime':       mtime(sqlanywhere),
+            'EngineMtime': mtime(environment.get('dbeng', '')),
+            'Environment': environment
+        }
+    if not os.path.isdir(os.path.dirname(ENVCACHEFILE)):
+        os.makedirs(os.path.dirname(ENVCACHEFILE))
+    tmpcachefilename = ENVCACHEFILE + '.' + str(os.getpid())
+    with open(tmpcachefilename, 'w') as cachefile:
+        json.dump(cache, cachefile)
+    os.replace(tmpcachefilename, ENVCACHEFILE)
+
+    return environment
+
+# Set up the environment for SQL Anywhere in this process. The SQL Anywhere client library
+# is loaded here so that the process need only be restarted, to pick up a changed library
+# search path, if the library cannot be loaded without it.
+def sqlanysetup(sqlanywhere=None, verbosity=1):
+    if os.name == 'nt' or os.environ.get('_sqlanywhere'):
+        return
+
+    os.environ.update(sqlanyenvironment(sqlanywhere, verbosity))
+    os.environ['_sqlanywhere'] = 'TRUE'
+
+    libpath = os.environ.get('libpath', '')
+    apidll  = os.environ.get('SQLANY_API_DLL')
+    if not apidll:
+        apidlls = glob.glob(os.path.join(libpath, 'libdbcapi_r.*'))
+        if apidlls:
+            apidll = apidlls[0]
+
+    loaded = False
+    if apidll:
+        chdir = os.environ.get('CHDIR')
+        if chdir:
+            cwd = os.getcwd()
+            os.chdir(chdir)
+        try:
+            ctypes.CDLL(apidll, mode=ctypes.RTLD_GLOBAL)
+            loaded = True
+        except OSError:
+            pass
+        finally:
+            if chdir:
+                os.chdir(cwd)
+
+    if loaded:
+        if os.path.isabs(apidll):
+            os.environ['SQLANY_API_DLL'] = apidll
+    else:
+        if verbosity > 1:
+            print("Restarting to load SQL Anywhere client library", file=sys.stderr)
+        os.execve(sys.argv[0], sys.argv, os.environ)
+
+class sqlanyAPI(object):
+    """Starts SQL Anywhere engines and attaches NVivo for Mac databases to them.
+
+    By default each database is served by a private engine which stops when its last
+    connection closes. A persistent engine instead keeps running after the process that
+    started it exits; its port and name are recorded in a state file so that later
+    invocations attach their databases to it rather than paying engine startup again.
+
+    Engines only listen on the loopback interface. The password of a persistent engine's
+    utility database, through which databases are started and the engine stopped, is
+    generated when it starts and kept in the state file, readable only by its owner.
+    """
+
+    USER     = 'wiwalisataob2aaf'
+    PASSWORD = 'iatvmoammgiivaam'
+
+    STATEDIR  = os.path.join(os.path.expanduser('~'), '.nvivotools')
+    STATEFILE = os.path.join(STATEDIR, 'sqlanywhere.json')
+    LOGFILE   = os.path.join(STATEDIR, 'sqlanywhere.log')
+
+    # Seconds to wait for a persistent engine to accept connections
+    STARTTIMEOUT = 60
+
+    def __init__(self, persistent=None, dbengfile=None, verbosity=1):
+        self.verbosity  = verbosity
+
+        if os.name == 'nt':
+            if dbengfile is None:
+                for path in os.environ['PATH'].split(';'):
+                    dbengpaths = glob.glob(path + '\\dbeng*.exe')
+                    if dbengpaths:
+                        dbengfile = os.path.basename(dbengpaths[0])
+                        break
+                else:
+                    raise RuntimeError("Could not find SQL Anywhere executable")
+        self.dbengfile = dbengfile
+
+        # Use a running persistent engine if there is one; start one only if asked to.
+        self.engine = self.running()
+        if self.engine is None and persistent:
+            self.engine = self.start()
+
+    # Build the command to run the engine with the given arguments
+    def enginecommand(self, arglist):
+        if os.name != 'nt':
+            return ['sh', helperpath + 'sqlanysrv.sh'] + arglist
+        else:
+            return ['dbspawn', '-f', self.dbengfile] + arglist
+
+    # Engine option to listen for connections on a port of the loopback interface only
+    @staticmethod
+    def tcpip(port):
+        return '-x TCPIP(port=' + port + ';MyIP=127.0.0.1)'
+
+    @staticmethod
+    def freeport():
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("",0))
+        port = str(s.getsockname()[1])
+        s.close()
+        return port
+
+    @staticmethod
+    def listening(port):
+        try:
+            socket.create_connection(('localhost', int(port)), 1).close()
+            return True
+        except socket.error:
+            return False
+
+    # Connect to the utility database of the persistent engine
+    def connect(self):
+        import sqlanydb
+
+        chdir = os.environ.get('CHDIR')
+        if chdir:
+            cwd = os.getcwd()
+            os.chdir(chdir)
+        try:
+            # Engines started by earlier versions used the fixed password
+            return sqlanydb.connect(uid='DBA', pwd=self.engine.get('UtilityPassword', sqlanyAPI.PASSWORD), eng=self.engine['ServerName'],
+                                    dbn='utility_db', host='localhost:' + self.engine['Port'])
+        finally:
+            if chdir:
+                os.chdir(cwd)
+
+    def execute(self, statement):
+        con = self.connect()
+        try:
+            con.cursor().execute(statement)
+        finally:
+            con.close()
+
+    # Return the persistent engine recorded in the state file if it is still running.
+    def running(self):
+        try:
+            with open(sqlanyAPI.STATEFILE, 'r') as statefile:
+                engine = json.load(statefile)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not sqlanyAPI.listening(engine['Port']):
+            return None
+        if self.verbosity > 1:
+            print("Found database server " + engine['ServerName'] + " on port " + engine['Port'], file=sys.stderr)
+        return engine
+
+    # Start a persistent engine with no databases and record it in the state file.
+    def start(self):
+        if not os.path.isdir(sqlanyAPI.STATEDIR):
+            os.makedirs(sqlanyAPI.STATEDIR)
+
+        port = sqlanyAPI.freeport()
+        engine = {'Port': port, 'ServerName': 'nvivotools' + port, 'UtilityPassword': secrets.token_hex(16)}
+        logfile = open(sqlanyAPI.LOGFILE, 'a')
+        # Start the engine in its own session so that it outlives this process.
+        dbproc = subprocess.Popen(self.enginecommand([sqlanyAPI.tcpip(port), '-n', engine['ServerName'], '-su', engine['UtilityPassword']]),
+                                  stdout=logfile, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                  **({'start_new_session': True} if os.name != 'nt' else {}))
+        logfile.close()
+
+        starttime = time.time()
+        while not sqlanyAPI.listening(port):
+            if dbproc.poll() is not None and os.name != 'nt':
+                raise RuntimeError("Failed to start database server, see " + sqlanyAPI.LOGFILE)
+            if time.time() - starttime > sqlanyAPI.STARTTIMEOUT:
+                raise RuntimeError("Timed out waiting for database server to start, see " + sqlanyAPI.LOGFILE)
+            time.sleep(0.2)
+
+        engine['Pid'] = dbproc.pid
+        tmpstatefilename = sqlanyAPI.STATEFILE + '.' + str(os.getpid())
+        with os.fdopen(os.open(tmpstatefilename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as statefile:
+            json.dump(engine, statefile)
+        os.replace(tmpstatefilename, sqlanyAPI.STATEFILE)
+
+        if self.verbosity > 0:
+            print("Started persistent database server on port " + port, file=sys.stderr)
+
+        return engine
+
+    # Stop the persistent engine, along with any databases still attached to it.
+    def stop(self):
+        if self.engine is None:
+            return
+
+        self.execute("STOP ENGINE UNCONDITIONALLY")
+        self.engine = None
+        os.remove(sqlanyAPI.STATEFILE)
+        if self.verbosity > 0:
+            print("Stopped persistent database server", file=sys.stderr)
+
+    # Attach a database file and return its SQLAlchemy URL. A database attached read-only
+    # is never written to, so it can be used in place rather than as a copy.
+    def attach(self, filename, dbname=None, readonly=False):
+        if not dbname:
+            dbname = "NVivo" + str(random.randint(0,99999)).zfill(5)
+
+        if self.engine is not None:
+            self.execute("START DATABASE '" + os.path.abspath(filename).replace("'", "''") + "' AS " + dbname
+                         + (" FOR READ ONLY" if readonly else "") + " AUTOSTOP OFF")
+            port = self.engine['Port']
+        else:
+            port = sqlanyAPI.freeport()
+            dbproc = subprocess.Popen(self.enginecommand([sqlanyAPI.tcpip(port), '-ga'] + (['-r'] if readonly else []) + [filename, '-n', dbname]), text=True,
+                                      stdout=subprocess.PIPE, stdin=subprocess.DEVNULL)
+            # Wait until SQL Anywhere engine starts...
+            while dbproc.poll() is None:
+                line = dbproc.stdout.readline()
+                if line == 'Now accepting requests\n' or 'SQL Anywhere Start Server In Background Utility' in line:
+                    break
+
+            if dbproc.poll() is not None:
+                raise RuntimeError("Failed to start database server")
+
+            if self.verbosity > 0:
+                print("Started database server on port " + port, file=sys.stderr)
+
+        if self.verbosity > 1:
+            print("Attached database " + dbname, file=sys.stderr)
+
+        return 'sqlalchemy_sqlany://' + sqlanyAPI.USER + ':' + sqlanyAPI.PASSWORD + '@localhost:' + port + '/' + dbname
+
+    # Detach a database so that its file can be moved. A private engine stops by itself
+    # once its database is no longer in use.
+    def detach(self, dbname):
+        if self.engine is not None:
+            self.execute("STOP DATABASE " + dbname + " UNCONDITIONALLY")
+            if self.verbosity > 1:
+                print("Detached database " + dbname, file=sys.stderr)
+
+    def list(self):
+        if self.engine is None:
+            return []
+
+        con = self.connect()
+        try:
+            cursor = con.cursor()
+            cursor.execute("SELECT DB_NAME(Number) FROM sa_db_list() WHERE DB_NAME(Number) <> 'utility_db'")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            con.close()
@@ -17,7 +17,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from argrecord import ArgumentHelper, ArgumentRecorder
-import os
 import sys
 from NVivoNorm import NVivoNorm
 from sqlalchemy import *
@@ -25,7 +24,7 @@ from textblob import TextBlob
 import uuid
 from datetime import datetime
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 def tagNounPhrases(arglist=None):
 
@@ -58,6 +57,7 @@ def tagNounPhrases(arglist=None):
         parser.write_comments(args, logfile, incomments=incomments)
         logfile.close()
 
+    norm = None
     try:
         norm = NVivoNorm(args.file)
         norm.begin()
@@ -191,16 +191,22 @@ def tagNounPhrases(arglist=None):
                         if lemma in lemmaFrequency.keys() and (args.threshold == 0 or lemmaFrequency[lemma] >= args.threshold):
                             if args.verbosity > 2:
                                 print("    Inserting tagging: " + str(sentence.start) + ':' + str(sentence.end - 1))
-                            norm.con.execute(norm.Tagging.insert().values({
+                            # Passed as parameters rather than values() so that files
+                            # without the fragment columns take the tagging too
+                            norm.con.execute(norm.Tagging.insert(), {
                                     'Id':           uuid.uuid4(),
                                     'Source':       sourceRow['Id'],
                                     'Node':         lemmaNode[lemma],
                                     'Fragment':     str(sentence.start) + ':' + str(sentence.end - 1),
+                                    'StartX':       sentence.start,
+                                    'EndX':         sentence.end - 1,
+                                    'StartY':       None,
+                                    'EndY':         None,
                                     'CreatedBy':    userId,
                                     'CreatedDate':  datetimeNow,
                                     'ModifiedBy':   userId,
                                     'ModifiedDate': datetimeNow
-                                }))
+                                })
 
         norm.commit()
 
@@ -209,7 +215,8 @@ def tagNounPhrases(arglist=None):
         norm.rollback()
 
     finally:
-        del norm
+        if norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     tagNounPhrases(None)
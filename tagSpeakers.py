@@ -17,7 +17,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from argrecord import ArgumentHelper, ArgumentRecorder
-import os
 import sys
 from NVivoNorm import NVivoNorm
 from sqlalchemy import *
@@ -25,7 +24,7 @@ from datetime import datetime
 import re
 import uuid
 
-exec(open(os.path.dirname(os.path.realpath(__file__)) + os.path.sep + 'DataTypes.py').read())
+from DataTypes import *
 
 def tagSpeakers(arglist=None):
 
@@ -58,6 +57,7 @@ def tagSpeakers(arglist=None):
         parser.write_comments(args, logfile, incomments=incomments)
         logfile.close()
 
+    norm = None
     try:
 
         norm = NVivoNorm(args.file)
@@ -160,6 +160,10 @@ def tagSpeakers(arglist=None):
                             'Source':       sourceRow['Id'],
                             'Node':         speakerId,
                             'Fragment':     fragment,
+                            'StartX':       speakerMatch.start(2),
+                            'EndX':         speakerMatch.end(2),
+                            'StartY':       None,
+                            'EndY':         None,
                             'CreatedBy':    userId,
                             'CreatedDate':  datetimeNow,
                             'ModifiedBy':   userId,
@@ -179,7 +183,8 @@ def tagSpeakers(arglist=None):
         norm.rollback()
 
     finally:
-        del norm
+        if norm is not None:
+            norm.close()
 
 if __name__ == '__main__':
     tagSpeakers(None)
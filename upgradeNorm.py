@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 Jonathan Schultz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import tempfile
+import shutil
+from sqlalchemy import create_engine, MetaData, Table, Column, Index, ForeignKey, String, LargeBinary, UnicodeText, select, bindparam
+from NVivoNorm import NVivoNorm, FRAGMENTCOLUMNS, parse_fragment, BLOBCOLUMNS, blob_column, store_blobs, \
+                      SOURCETEXT, has_source_text_index, create_source_text_index, drop_source_text_index, is_source_text_table, \
+                      source_text_compressed, COMPRESSEDTYPES
+
+# Number of rows copied at a time when rewriting a file
+BATCHSIZE = 1000
+
+# Reflect the ordinary tables of a normalised file
+def reflect_file(db):
+    md = MetaData(bind=db)
+    md.reflect(db, only=lambda tablename, md: not is_source_text_table(tablename))
+    return md
+
+# Copy the tables of a normalised file to a new file described by newmd, which then
+# replaces the original. Tables that are not in newmd are dropped. Each table's rows are
+# read with selecttable(table), if given, and passed through prepare(newcon, newtable,
+# rows), if given, before being written. A source text index is built afresh.
+def rewrite_file(filename, db, md, newmd, selecttable=None, prepare=None, verbosity=1):
+    tmpfd, tmpfilename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)))
+    os.close(tmpfd)
+    newdb = create_engine('sqlite:///' + tmpfilename)
+    try:
+        newmd.create_all(newdb)
+
+        with db.connect() as con, newdb.connect() as newcon:
+            newtr = newcon.begin()
+            for table in md.sorted_tables:
+                newtable = newmd.tables.get(table.name)
+                if newtable is None:
+                    continue
+                if verbosity > 1:
+                    print("Copying table " + table.name, file=sys.stderr)
+                rows = con.execute(selecttable(table) if selecttable else table.select())
+                while True:
+                    batch = rows.fetchmany(BATCHSIZE)
+                    if not batch:
+                        break
+                    batch = [dict(row) for row in batch]
+                    if prepare:
+                        prepare(newcon, newtable, batch)
+                    newcon.execute(newtable.insert(), batch)
+            if has_source_text_index(con):
+                if source_text_compressed(newcon):
+                    print("WARNING: Dropping text index since source text is now compressed", file=sys.stderr)
+                else:
+                    create_source_text_index(newcon, verbosity)
+            newtr.commit()
+    except:
+        newdb.dispose()
+        os.remove(tmpfilename)
+        raise
+    finally:
+        db.dispose()
+
+    newdb.dispose()
+    shutil.copymode(filename, tmpfilename)
+    os.replace(tmpfilename, filename)
+
+# Rewrite a normalised file with its UUIDs stored as text or as binary, returning whether
+# anything needed to be changed. Every table is copied, along with its indexes.
+def convert_uuids(filename, binary, verbosity=1):
+    db = create_engine('sqlite:///' + filename)
+    textuuid   = db.dialect.ischema_names['UNIQUEIDENTIFIER']
+    binaryuuid = db.dialect.ischema_names['UUIDBLOB']
+    fromtype, totype = (textuuid, binaryuuid) if binary else (binaryuuid, textuuid)
+
+    md = reflect_file(db)
+    if not any(isinstance(column.type, fromtype) for table in md.tables.values() for column in table.c):
+        db.dispose()
+        return False
+
+    newmd = MetaData()
+    for table in md.sorted_tables:
+        newtable = table.tometadata(newmd)
+        for column in newtable.c:
+            if isinstance(column.type, fromtype):
+                column.type = totype()
+
+    rewrite_file(filename, db, md, newmd, verbosity=verbosity)
+    return True
+
+# Rewrite a normalised file with its source objects and thumbnails kept in the Source
+# table or in a separate Blob table, returning whether anything needed to be changed.
+def convert_blobs(filename, blobtable, verbosity=1):
+    db = create_engine('sqlite:///' + filename)
+    md = reflect_file(db)
+    source = md.tables['Source']
+    blob   = md.tables.get('Blob')
+    if blobtable == ('Object' not in source.c):
+        db.dispose()
+        return False
+
+    newmd = MetaData()
+    for table in md.sorted_tables:
+        if table is not source and table is not blob:
+            table.tometadata(newmd)
+
+    # Object and Thumbnail are replaced by ObjectHash and ThumbnailHash, or the reverse
+    blobnames = {column: column + 'Hash' for column in BLOBCOLUMNS}
+    # Source objects stay compressed if they were
+    objecttype = type(source.c.Object.type if 'Object' in source.c else blob.c.Data.type)
+    if blobtable:
+        newblob = Table('Blob', newmd,
+            Column('Hash',          String(64),     primary_key=True),
+            Column('Data',          objecttype()))
+        columns = [Column(blobnames[column.name], String(64), ForeignKey("Blob.Hash")) if column.name in blobnames else column.copy()
+                   for column in source.c]
+    else:
+        hashnames = {hashname: column for column, hashname in blobnames.items()}
+        columns = [Column(hashnames[column.name], objecttype() if hashnames[column.name] == 'Object' else LargeBinary())
+                   if column.name in hashnames else column.copy()
+                   for column in source.c]
+    newsource = Table('Source', newmd, *columns)
+    for constraint in source.foreign_key_constraints:
+        if all(column.name in newsource.c for column in constraint.columns):
+            newsource.append_constraint(constraint.copy())
+    for index in source.indexes:
+        Index(index.name, *[newsource.c[column.name] for column in index.columns], unique=index.unique)
+
+    def selecttable(table):
+        if table is source and not blobtable:
+            return select([column for column in source.c if column.name not in blobnames.values()]
+                          + [blob_column(source, blob, column) for column in BLOBCOLUMNS])
+        return table.select()
+
+    def prepare(newcon, newtable, rows):
+        if newtable is newsource and blobtable:
+            store_blobs(newcon, newsource, newblob, rows)
+
+    rewrite_file(filename, db, md, newmd, selecttable, prepare, verbosity)
+    return True
+
+# Rewrite a normalised file with its source objects and text compressed with a codec,
+# or uncompressed if codec is None, returning whether anything needed to be changed.
+def convert_compression(filename, codec, verbosity=1):
+    db = create_engine('sqlite:///' + filename)
+    md = reflect_file(db)
+    if codec:
+        objecttype, contenttype = COMPRESSEDTYPES[codec]
+    else:
+        objecttype, contenttype = LargeBinary, lambda: UnicodeText(16384)
+
+    columns = [('Source', 'Content', contenttype), ('Source', 'Object', objecttype), ('Blob', 'Data', objecttype)]
+    columns = [(tablename, columnname, columntype) for tablename, columnname, columntype in columns
+               if tablename in md.tables and columnname in md.tables[tablename].c]
+    if all(getattr(md.tables[tablename].c[columnname].type, 'codec', None) == codec for tablename, columnname, columntype in columns):
+        db.dispose()
+        return False
+
+    newmd = MetaData()
+    for table in md.sorted_tables:
+        table.tometadata(newmd)
+    for tablename, columnname, columntype in columns:
+        newmd.tables[tablename].c[columnname].type = columntype()
+
+    rewrite_file(filename, db, md, newmd, verbosity=verbosity)
+    return True
+
+# Add any missing fragment columns to the Tagging table and fill them in for taggings
+# that lack them, returning the number of taggings filled in.
+def add_fragment_columns(filename, verbosity=1):
+    db = create_engine('sqlite:///' + filename)
+    try:
+        with db.connect() as con:
+            tr = con.begin()
+            tagging = Table('Tagging', MetaData(), autoload=True, autoload_with=con)
+            missing = [column for column in FRAGMENTCOLUMNS if column not in tagging.c]
+            for column in missing:
+                if verbosity > 1:
+                    print("Adding column Tagging." + column, file=sys.stderr)
+                con.execute('ALTER TABLE Tagging ADD COLUMN ' + column + ' INTEGER')
+            if missing:
+                tagging = Table('Tagging', MetaData(), autoload=True, autoload_with=con)
+
+            update = tagging.update().where(
+                    tagging.c.Id == bindparam('_Id')
+                ).values({column: bindparam(column) for column in FRAGMENTCOLUMNS})
+            rows = con.execute(select([
+                    tagging.c.Id,
+                    tagging.c.Fragment
+                ]).where(
+                    tagging.c.StartX.is_(None)
+                )).fetchall()
+
+            filled = 0
+            for start in range(0, len(rows), BATCHSIZE):
+                batch = []
+                for row in rows[start:start+BATCHSIZE]:
+                    fragment = parse_fragment(row['Fragment'])
+                    if fragment['StartX'] is not None:
+                        fragment['_Id'] = row['Id']
+                        batch.append(fragment)
+                if batch:
+                    con.execute(update, batch)
+                    filled += len(batch)
+            tr.commit()
+    finally:
+        db.dispose()
+
+    return filled
+
+def upgradeNorm(arglist=None):
+
+    parser = argparse.ArgumentParser(description='Bring normalised files up to date with the current version of NVivotools, adding any missing columns and indexes.')
+
+    parser.add_argument('-v', '--verbosity', type=int, default=1)
+    parser.add_argument('--uuids', choices=["text", "binary"],
+                        help='Convert the UUIDs in each file to text, readable by older versions of NVivotools, or to compact binary.')
+    parser.add_argument('--blobs', choices=["inline", "table"],
+                        help='Keep source objects and thumbnails in the Source table, readable by older versions of NVivotools, or in a separate table.')
+
+    parser.add_argument('--compress', choices=["none", "zlib", "zstd"],
+                        help='Store source objects and text compressed, or uncompressed as read by older versions of NVivotools; zstd needs the zstandard module.')
+
+    parser.add_argument('--text-index', choices=["add", "drop"],
+                        help='Add, or bring up to date, a full text index of source content for searchSource, or drop it.')
+
+    parser.add_argument('file', type=str, nargs='+',
+                        help='Normalised NVivo (.nvpn) file')
+
+    args = parser.parse_args(arglist)
+
+    # Check every file before converting any, so that a text index that cannot be added
+    # does not leave files half upgraded.
+    for filename in args.file:
+        if not os.path.isfile(filename):
+            raise RuntimeError("File not found: " + filename)
+
+        if args.text_index == 'add':
+            if args.compress in ['zlib', 'zstd']:
+                raise RuntimeError("--compress " + args.compress + " cannot be used with --text-index add, as compressed source text cannot be indexed")
+            if args.compress is None:
+                db = create_engine('sqlite:///' + filename)
+                try:
+                    with db.connect() as con:
+                        compressed = source_text_compressed(con)
+                finally:
+                    db.dispose()
+                if compressed:
+                    raise RuntimeError(filename + ": source text is compressed and cannot be indexed; use --compress none")
+
+    for filename in args.file:
+
+        if args.uuids:
+            if convert_uuids(filename, args.uuids == 'binary', args.verbosity) and args.verbosity > 0:
+                print(filename + ": converted UUIDs to " + args.uuids, file=sys.stderr)
+
+        if args.blobs:
+            if convert_blobs(filename, args.blobs == 'table', args.verbosity) and args.verbosity > 0:
+                print(filename + ": moved source blobs " + ("to a separate table" if args.blobs == 'table' else "into the Source table"), file=sys.stderr)
+
+        if args.compress:
+            if convert_compression(filename, args.compress if args.compress != 'none' else None, args.verbosity) and args.verbosity > 0:
+                print(filename + ": " + ("compressed sources with " + args.compress if args.compress != 'none' else "uncompressed sources"), file=sys.stderr)
+
+        filled = add_fragment_columns(filename, args.verbosity)
+        if filled and args.verbosity > 0:
+            print(filename + ": filled in fragment columns of " + str(filled) + " tagging(s)", file=sys.stderr)
+
+        norm = NVivoNorm(filename, deferindexes=True)
+        try:
+            norm.begin()
+            created = norm.createindexes(verbosity=args.verbosity)
+            if args.text_index == 'add':
+                if create_source_text_index(norm.con, args.verbosity):
+                    created.append(SOURCETEXT)
+            elif args.text_index == 'drop':
+                drop_source_text_index(norm.con)
+            norm.commit()
+        except:
+            norm.rollback()
+            raise
+        finally:
+            norm.close()
+
+        if args.verbosity > 0:
+            print(filename + ": created " + str(len(created)) + " index(es)", file=sys.stderr)
+
+if __name__ == '__main__':
+    upgradeNorm(None)